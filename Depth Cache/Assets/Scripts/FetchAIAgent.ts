@@ -1,26 +1,33 @@
+// Downsampled depth frame in metres (spectacles_controller.extractDepthData)
+type DepthGrid = {width: number, height: number, values: number[]};
+
 @component
 export class FetchAIAgent extends BaseScriptComponent {
     
     private readonly STORAGE_AGENT_URL = "https://agentverse.ai/v1/agents/{storage_address}/messages";
+    // Storage agent binary ingest endpoint (multipart JPEG + binary depth grid, no base64)
+    private readonly STORAGE_INGEST_URL = "http://{storage_host}:8011/ingest";
     
     sendMealCapture(
         texture: Texture,
-        depthFrameID: number,
+        depthData: DepthGrid | null,
         sessionId: string,
         userId: string,
         callback: (result: any) => void
     ) {
         const imageBase64 = this.textureToBase64(texture);
-        // No depth data extraction needed
         
-        const fetchAIMessage = {
+        const fetchAIMessage: any = {
             type: "UploadRequest",
             image_base64: imageBase64,
             session_id: sessionId,
             frame_id: `frame_${Date.now()}`,
             user_id: userId
-            // No depth_data field
         };
+        // The analysis agent measures food volume from this; without it, it falls back to a fixed pattern
+        if (depthData && depthData.values.length > 0) {
+            fetchAIMessage.depth_data = depthData;
+        }
         
         const request = RemoteServiceModule.createRequest(this.STORAGE_AGENT_URL);
         request.method = RemoteServiceModule.HttpRequestMethod.Post;
@@ -33,6 +40,97 @@ export class FetchAIAgent extends BaseScriptComponent {
         });
     }
     
+    sendMealCaptureBinary(
+        texture: Texture,
+        depthData: DepthGrid | null,
+        sessionId: string,
+        userId: string,
+        callback: (result: any) => void
+    ) {
+        const jpegBytes = this.textureToJpegBytes(texture);
+        if (!jpegBytes) {
+            // Fall back to the base64 UploadRequest path
+            this.sendMealCapture(texture, depthData, sessionId, userId, callback);
+            return;
+        }
+        
+        const query = `session_id=${encodeURIComponent(sessionId)}` +
+            `&frame_id=${encodeURIComponent(`frame_${Date.now()}`)}` +
+            `&user_id=${encodeURIComponent(userId)}`;
+        
+        const request = RemoteServiceModule.createRequest(`${this.STORAGE_INGEST_URL}?${query}`);
+        request.method = RemoteServiceModule.HttpRequestMethod.Post;
+        
+        if (depthData && depthData.values.length > 0) {
+            const boundary = `----meal${Date.now()}`;
+            request.setHeader("Content-Type", `multipart/form-data; boundary=${boundary}`);
+            request.body = this.multipartBody(boundary, [
+                {name: "image", contentType: "image/jpeg", bytes: jpegBytes},
+                {name: "depth", contentType: "application/x-depth-grid", bytes: this.encodeDepthGrid(depthData)}
+            ]);
+        } else {
+            request.setHeader("Content-Type", "image/jpeg");
+            request.body = jpegBytes;
+        }
+        request.send((response) => {
+            const analysisResult = JSON.parse(response.body);
+            callback(analysisResult);
+        });
+    }
+    
+    // Binary depth grid as read by backend/depth_format.py: 16-byte header, then uncompressed
+    // little-endian uint16 millimetres (0 = no reading)
+    private encodeDepthGrid(depthData: DepthGrid): Uint8Array {
+        const count = depthData.width * depthData.height;
+        const bytes = new Uint8Array(16 + 2 * count);
+        const view = new DataView(bytes.buffer);
+        bytes.set([0x44, 0x50, 0x54, 0x48], 0);  // "DPTH"
+        view.setUint8(4, 1);                     // version
+        view.setUint8(5, 2);                     // dtype: uint16 millimetres
+        view.setUint8(6, 0);                     // codec: none
+        view.setUint8(7, 0);                     // reserved
+        view.setUint16(8, depthData.width, true);
+        view.setUint16(10, depthData.height, true);
+        view.setFloat32(12, 0.001, true);        // metres per stored unit
+        for (let i = 0; i < count; i++) {
+            const metres = depthData.values[i];
+            const millimetres = isFinite(metres) && metres > 0 ? Math.min(65535, Math.max(1, Math.round(metres * 1000))) : 0;
+            view.setUint16(16 + 2 * i, millimetres, true);
+        }
+        return bytes;
+    }
+    
+    private multipartBody(boundary: string, parts: {name: string, contentType: string, bytes: Uint8Array}[]): Uint8Array {
+        const ascii = (text: string) => Uint8Array.from(text, (char) => char.charCodeAt(0));
+        const chunks: Uint8Array[] = [];
+        for (const part of parts) {
+            chunks.push(ascii(`--${boundary}\r\nContent-Disposition: form-data; name="${part.name}"; filename="${part.name}"\r\n` +
+                `Content-Type: ${part.contentType}\r\n\r\n`));
+            chunks.push(part.bytes);
+            chunks.push(ascii("\r\n"));
+        }
+        chunks.push(ascii(`--${boundary}--\r\n`));
+        
+        const body = new Uint8Array(chunks.reduce((size, chunk) => size + chunk.length, 0));
+        let offset = 0;
+        for (const chunk of chunks) {
+            body.set(chunk, offset);
+            offset += chunk.length;
+        }
+        return body;
+    }
+    
+    private textureToJpegBytes(texture: Texture): Uint8Array | null {
+        try {
+            if ((texture as any).encode) {
+                return new Uint8Array((texture as any).encode("jpg", 80));
+            }
+        } catch (error) {
+            print("⚠️ Texture encode error: " + error);
+        }
+        return null;
+    }
+    
     // Helper methods from spectacles_controller.ts
     private textureToBase64(texture: Texture): string {
         try {
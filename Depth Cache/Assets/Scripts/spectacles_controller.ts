@@ -136,10 +136,13 @@ export class SpectaclesController extends BaseScriptComponent {
                 return;
             }
             
-            // 3. Use FetchAIAgent for analysis
+            // 3. Downsampled depth for the backend's volume measurement
+            const depthData = this.extractDepthData(depthFrameID);
+            
+            // 4. Use FetchAIAgent for analysis
             this.fetchAIAgent.sendMealCapture(
                 cameraTexture,
-                depthFrameID,
+                depthData.values.length > 0 ? depthData : null,
                 this.sessionId,
                 this.userId,
                 (analysisResult) => {
@@ -2,12 +2,18 @@
 from uagents import Agent, Context, Protocol, Model
 from uagents.setup import fund_agent_if_low
 import google.generativeai as genai
+from gemini_client import generate_content
 from typing import List, Optional
-import requests
-from PIL import Image
-import io
+from http_client import fetch_bytes, close_client
+from depth_format import decode_depth, is_depth_grid
+from image_preprocess import prepare_image
+from plate_volume import plate_food_volume_ml, volume_consumption, record_volume
+from session_store import session_store
+from http_sidecar import start_metrics_sidecar, METRICS_PORT_OFFSET
+from metrics import metrics
+from analysis_schema import ANALYSIS_FIELDS, complete_analysis, parse_reply, response_config
+import asyncio
 import json
-import re
 import time
 import os
 from dotenv import load_dotenv
@@ -35,8 +41,8 @@ class AnalysisResult(Model):
     estimated_calories: int
     confidence: float
 
-# Session storage (from test.py)
-sessions = {}
+# Session storage: bounded in-memory tier over SQLite (session_store.py)
+SESSION_STATS_LOG_SECONDS = float(os.getenv("SESSION_STATS_LOG_SECONDS", "300"))
 
 # Create Analysis Agent
 analysis_agent = Agent(
@@ -48,6 +54,7 @@ analysis_agent = Agent(
 )
 
 fund_agent_if_low(analysis_agent.wallet.address())
+metrics.set_agent(analysis_agent.name)
 
 # Chat Protocol ONLY (no REST endpoints)
 meal_protocol = Protocol(name="MealTrackingChat")
@@ -58,14 +65,22 @@ async def handle_meal_analysis(ctx: Context, sender: str, msg: CaptureRequest):
     
     try:
         # Download from URLs
-        image = download_image(msg.image_url)
-        depth_data = download_depth(msg.depth_url)
+        image = await download_image(msg.image_url)
+        try:
+            depth_data = await download_depth(msg.depth_url)
+        except Exception as e:
+            # A missing or corrupt grid only costs the volume measurement, not the analysis
+            ctx.logger.warning(f"⚠️ Depth unusable, volume unavailable: {e}")
+            depth_data = UNAVAILABLE_DEPTH_DATA
+        
+        # Measure food volume from the depth grid (no model call)
+        volume_ml = plate_food_volume_ml(depth_data)
         
         # Analyze with Gemini (reuse from test.py)
-        analysis = await analyze_food_with_gemini(msg, image, depth_data, ctx)
+        analysis = await analyze_food_with_gemini(msg, image, depth_data, ctx, volume_ml)
         
         # Update session (from test.py)
-        update_session(msg.session_id, analysis)
+        update_session(msg.session_id, analysis, volume_ml)
         
         # Return AnalysisResult (NO DogState)
         await ctx.send(sender, analysis)
@@ -83,35 +98,72 @@ async def handle_meal_analysis(ctx: Context, sender: str, msg: CaptureRequest):
 
 analysis_agent.include(meal_protocol)
 
-# Helper functions
-def download_image(image_url: str) -> Image.Image:
-    """Download image from URL"""
-    response = requests.get(image_url)
-    return Image.open(io.BytesIO(response.content))
+@analysis_agent.on_event("startup")
+async def start_metrics_server(ctx: Context):
+    await start_metrics_sidecar(8000)
+    ctx.logger.info(f"📊 Metrics endpoint: http://localhost:{8000 + METRICS_PORT_OFFSET}/metrics")
+
+@analysis_agent.on_event("shutdown")
+async def close_http_client(ctx: Context):
+    await close_client()
 
-def download_depth(depth_url: str) -> dict:
-    """Download depth data from URL"""
-    response = requests.get(depth_url)
-    return response.json()
+@analysis_agent.on_event("startup")
+async def warm_session_store(ctx: Context):
+    warmed = await asyncio.to_thread(session_store.warm)
+    ctx.logger.info(f"🍽️ Warmed {warmed} recently active sessions")
 
-def update_session(session_id: str, analysis: AnalysisResult):
+@analysis_agent.on_interval(period=SESSION_STATS_LOG_SECONDS)
+async def log_session_stats(ctx: Context):
+    ctx.logger.info(f"🍽️ Session store: {session_store.stats()}")
+
+# Helper functions
+async def download_image(image_url: str) -> dict:
+    """Download image from URL and prepare it for Gemini (downscaled JPEG blob)"""
+    with metrics.track("image_download"):
+        image_bytes = await fetch_bytes(image_url)
+    metrics.add_bytes("image_download", len(image_bytes))
+    # Decoding is CPU-bound, keep it off the event loop
+    with metrics.track("image_decode"):
+        return await asyncio.to_thread(prepare_image, image_bytes)
+
+# Stands in for a depth grid that couldn't be downloaded or decoded (no volume is measured from it)
+UNAVAILABLE_DEPTH_DATA = {"width": 0, "height": 0, "values": [], "synthetic": True}
+
+async def download_depth(depth_url: str) -> dict:
+    """Download depth data from URL (binary depth grid, or legacy JSON)"""
+    data = await fetch_bytes(depth_url)
+    if is_depth_grid(data):
+        return decode_depth(data)
+    return json.loads(data)
+
+def update_session(session_id: str, analysis: AnalysisResult, volume_ml: Optional[float] = None):
     """Update session state (from test.py)"""
-    session = sessions.get(session_id, {
+    session = session_store.get(session_id) or {
         'total_consumed': 0,
         'captures': 0,
         'start_time': int(time.time())
-    })
+    }
     
     session['total_consumed'] += analysis.consumed_since_last
     session['captures'] += 1
-    sessions[session_id] = session
+    record_volume(session, volume_ml)
+    session_store.put(session_id, session)
 
 # Reuse analyze_food_with_gemini function from test.py (modified for URL input)
-async def analyze_food_with_gemini(msg: CaptureRequest, image: Image.Image, depth_data: dict, ctx: Context) -> AnalysisResult:
+async def analyze_food_with_gemini(msg: CaptureRequest, image: dict, depth_data: dict, ctx: Context,
+                                   volume_ml: Optional[float] = None) -> AnalysisResult:
     """Analyze food using Gemini Vision API (modified from test.py)"""
     
     # Get previous state
-    prev_state = sessions.get(msg.session_id, {})
+    prev_state = session_store.get(msg.session_id)
+    
+    # Measured volume change against the session's first frame, when depth allows it
+    consumption = volume_consumption(prev_state, volume_ml) if volume_ml is not None else None
+    if consumption:
+        volume_info = (f"Measured food volume: {volume_ml:.0f} ml "
+                       f"({consumption['remaining_percent']}% of the first frame's {consumption['baseline_volume_ml']:.0f} ml)")
+    else:
+        volume_info = "Measured food volume: unavailable"
     
     # Build prompt (same as test.py)
     prompt = f"""
@@ -122,6 +174,7 @@ async def analyze_food_with_gemini(msg: CaptureRequest, image: Image.Image, dept
     
     Depth info: {depth_data['width']}x{depth_data['height']} pixels
     Sample depth values: {depth_data['values'][:5]}...
+    {volume_info}
     
     Return JSON only:
     {{
@@ -138,13 +191,17 @@ async def analyze_food_with_gemini(msg: CaptureRequest, image: Image.Image, dept
     try:
         # Call Gemini
         ctx.logger.info("🔍 Calling Gemini Vision API...")
-        response = model.generate_content([prompt, image])
+        response = await generate_content(model, [prompt, image], generation_config=response_config())
         
-        # Parse JSON response (same as test.py)
-        json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-            return AnalysisResult(**data)
+        # JSON mode reply; fields that fail validation are re-requested on their own (same as test.py)
+        parsed = parse_reply(response.text)
+        values, invalid = parsed[0] if parsed else ({}, list(ANALYSIS_FIELDS))
+        result = AnalysisResult(**await complete_analysis(model, values, invalid, image, ctx))
+        # Depth measurement beats the model's visual estimate of portions
+        if consumption:
+            result.remaining_percent = consumption['remaining_percent']
+            result.consumed_since_last = consumption['consumed_since_last']
+        return result
         
     except Exception as e:
         ctx.logger.error(f"Gemini analysis failed: {str(e)}")
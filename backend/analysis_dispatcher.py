@@ -0,0 +1,173 @@
+# analysis_dispatcher.py
+from uagents import Agent, Context, Protocol, Model
+from uagents.setup import fund_agent_if_low
+from analysis_models import CaptureRequest, AnalysisResult, FoodItem
+from analysis_sharding import (HashRing, WorkerHeartbeat, agent_resolver, ANALYSIS_WORKERS, ANALYSIS_DISPATCHER_PORT,
+                               DISPATCHER_SEED, WORKER_HEARTBEAT_SECONDS, WORKER_HEARTBEAT_TIMEOUT,
+                               worker_address, worker_endpoint)
+from http_sidecar import start_metrics_sidecar, METRICS_PORT_OFFSET
+from metrics import metrics
+from contextlib import asynccontextmanager
+from typing import List
+import asyncio
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds to wait for a worker's analysis before trying the next worker on the ring
+DISPATCH_TIMEOUT = int(os.getenv("DISPATCH_TIMEOUT", "90"))
+
+class WorkerStats(Model):
+    ring_workers: int
+    workers: List[dict]
+
+# Workers are addressed directly on the local network; everything else resolves via the Almanac
+dispatcher = Agent(
+    name="eating_support_dispatcher",
+    seed=DISPATCHER_SEED,
+    port=ANALYSIS_DISPATCHER_PORT,
+    endpoint=[f"http://0.0.0.0:{ANALYSIS_DISPATCHER_PORT}/submit"],
+    agentverse="https://agentverse.ai",  # Connect to Agentverse
+    mailbox=True,
+    resolve=agent_resolver({worker_address(i): worker_endpoint(i) for i in range(ANALYSIS_WORKERS)}),
+    # Forwarding waits on workers, so requests for different sessions must not queue behind each other
+    handle_messages_concurrently=True
+)
+
+fund_agent_if_low(dispatcher.wallet.address())
+metrics.set_agent(dispatcher.name)
+
+# Every configured worker starts on the ring; heartbeats keep it there
+ring = HashRing()
+workers = {}
+for index in range(ANALYSIS_WORKERS):
+    address = worker_address(index)
+    workers[address] = {
+        'index': index,
+        'address': address,
+        'alive': True,
+        'last_heartbeat': time.time(),
+        'in_flight': 0,
+        'worker_in_flight': 0,
+        'dispatched': 0,
+        'failed': 0
+    }
+    ring.add(address)
+
+# Per-session locks keep a session's frames in order on its worker
+session_locks = {}
+# Replies are matched on (worker, uagents session), so requests sharing a session take turns per worker
+reply_locks = {}
+
+@asynccontextmanager
+async def keyed_lock(locks: dict, key):
+    """Hold the lock for key; entries ([lock, waiting requests]) are dropped once nobody waits"""
+    entry = locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del locks[key]
+
+def set_alive(ctx: Context, worker: dict, alive: bool):
+    """Join or leave the ring; only sessions on the worker's arcs move"""
+    if worker['alive'] == alive:
+        return
+    worker['alive'] = alive
+    if alive:
+        ring.add(worker['address'])
+        ctx.logger.info(f"➕ Worker {worker['index']} joined ({len(ring.nodes)} on ring)")
+    else:
+        ring.remove(worker['address'])
+        ctx.logger.warning(f"➖ Worker {worker['index']} left ({len(ring.nodes)} on ring)")
+
+dispatch_protocol = Protocol(name="MealTrackingChat")
+
+@dispatch_protocol.on_message(model=CaptureRequest, replies={AnalysisResult})
+async def dispatch_capture(ctx: Context, sender: str, msg: CaptureRequest):
+    """Forward a capture to the worker owning its session and relay the reply"""
+    async with keyed_lock(session_locks, msg.session_id):
+        result = await forward_to_worker(ctx, msg)
+
+    await ctx.send(sender, result)
+
+async def forward_to_worker(ctx: Context, msg: CaptureRequest) -> AnalysisResult:
+    # A worker that fails to answer leaves the ring, so the retry lands on its successor
+    for _ in range(max(1, ANALYSIS_WORKERS)):
+        address = ring.lookup(msg.session_id)
+        if address is None:
+            break
+        worker = workers[address]
+        worker['in_flight'] += 1
+        worker['dispatched'] += 1
+        started = time.perf_counter()
+        reply = None
+        try:
+            async with keyed_lock(reply_locks, (address, ctx.session)):
+                reply, status = await ctx.send_and_receive(address, msg, response_type=AnalysisResult,
+                                                           timeout=DISPATCH_TIMEOUT)
+        finally:
+            worker['in_flight'] -= 1
+            metrics.observe("worker_dispatch", time.perf_counter() - started, "ok" if reply is not None else "error")
+        if reply is not None:
+            return reply
+
+        worker['failed'] += 1
+        ctx.logger.error(f"❌ Worker {worker['index']} gave no reply for {msg.session_id}: {status}")
+        set_alive(ctx, worker, False)
+
+    ctx.logger.error(f"❌ No live workers for session {msg.session_id}")
+    return AnalysisResult(
+        food_items=[FoodItem(name="analysis_failed", category="error")],
+        remaining_percent=100.0,
+        consumed_since_last=0.0,
+        estimated_calories=0,
+        confidence=0.0
+    )
+
+@dispatch_protocol.on_message(model=WorkerHeartbeat)
+async def handle_heartbeat(ctx: Context, sender: str, msg: WorkerHeartbeat):
+    worker = workers.get(sender)
+    # The ring is fixed at workers 0..ANALYSIS_WORKERS-1 (their endpoints are only resolvable for that range);
+    # workers beyond it are not added until the dispatcher restarts with a larger ANALYSIS_WORKERS
+    if worker is None or worker['index'] != msg.worker_index:
+        ctx.logger.warning(f"Heartbeat from unknown worker {msg.worker_index} ({sender}) ignored: "
+                           f"only workers 0..{ANALYSIS_WORKERS - 1} are on the ring")
+        return
+    worker['last_heartbeat'] = time.time()
+    worker['worker_in_flight'] = msg.in_flight
+    set_alive(ctx, worker, not msg.leaving)
+
+dispatcher.include(dispatch_protocol)
+
+@dispatcher.on_interval(period=WORKER_HEARTBEAT_SECONDS)
+async def expire_silent_workers(ctx: Context):
+    now = time.time()
+    for worker in workers.values():
+        if worker['alive'] and now - worker['last_heartbeat'] > WORKER_HEARTBEAT_TIMEOUT:
+            set_alive(ctx, worker, False)
+
+@dispatcher.on_event("startup")
+async def start_metrics_server(ctx: Context):
+    await start_metrics_sidecar(ANALYSIS_DISPATCHER_PORT)
+    ctx.logger.info(f"📊 Metrics endpoint: http://localhost:{ANALYSIS_DISPATCHER_PORT + METRICS_PORT_OFFSET}/metrics")
+
+@dispatcher.on_rest_get("/workers", WorkerStats)
+async def get_worker_stats(ctx: Context) -> WorkerStats:
+    """Ring membership and per-worker queue depth (in_flight = forwarded and awaiting a reply)"""
+    return WorkerStats(
+        ring_workers=len(ring.nodes),
+        workers=[dict(worker, last_heartbeat=round(worker['last_heartbeat'], 1)) for worker in workers.values()]
+    )
+
+if __name__ == "__main__":
+    print("🚀 Starting Analysis Dispatcher...")
+    print(f"📍 Agent address: {dispatcher.address}")
+    print(f"🌐 HTTP endpoint: http://localhost:{ANALYSIS_DISPATCHER_PORT}")
+    print(f"🔀 Sharding sessions across {ANALYSIS_WORKERS} workers")
+    dispatcher.run()
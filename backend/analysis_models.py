@@ -0,0 +1,26 @@
+# analysis_models.py
+# Messages of the live analysis agent. Kept apart from test.py so senders (storage agent,
+# dispatcher) can import them without constructing the analysis Agent in their own process.
+from typing import List, Optional
+
+from pydantic import BaseModel
+from uagents import Model
+
+class FoodItem(BaseModel):
+    name: str
+    category: Optional[str] = None
+
+class AnalysisResult(BaseModel):
+    food_items: List[FoodItem]
+    remaining_percent: float
+    consumed_since_last: float
+    estimated_calories: int
+    confidence: float
+
+# MODIFIED: Use URLs instead of base64
+class CaptureRequest(Model):
+    session_id: str
+    user_id: str
+    image_url: str  # JPEG URL only
+    timestamp: int
+    depth_url: Optional[str] = None  # Binary depth grid (depth_format.py), if captured
@@ -0,0 +1,144 @@
+# analysis_schema.py
+# Structured Gemini output for AnalysisResult: the response schema sent with each request,
+# a validating parser that reports which fields of a reply are unusable, and the follow-up
+# requests for those fields, shared by the live analysis agents.
+import json
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from analysis_models import AnalysisResult
+from gemini_client import generate_content
+from metrics import metrics
+
+load_dotenv()
+
+# Follow-up requests for the fields of a reply that failed validation (0 = fall back right away)
+ANALYSIS_FIELD_RETRIES = int(os.getenv("ANALYSIS_FIELD_RETRIES", "1"))
+
+ANALYSIS_FIELDS = tuple(AnalysisResult.model_fields)
+
+# Accepted ranges; also sent to Gemini as the field descriptions
+FIELD_RANGES = {
+    "remaining_percent": (0, 100),
+    "consumed_since_last": (0, 100),
+    "estimated_calories": (0, 5000),
+    "confidence": (0, 1)
+}
+
+def _gemini_schema(node: dict, defs: dict) -> dict:
+    """Pydantic JSON schema node -> the OpenAPI subset Gemini accepts (no $ref, anyOf, title, default)"""
+    if '$ref' in node:
+        return _gemini_schema(defs[node['$ref'].rsplit('/', 1)[-1]], defs)
+    if 'anyOf' in node:
+        # Optional[X] -> X, nullable
+        option = next(option for option in node['anyOf'] if option.get('type') != 'null')
+        return dict(_gemini_schema(option, defs), nullable=True)
+    schema = {'type': node['type']}
+    if node['type'] == 'object':
+        schema['properties'] = {name: _gemini_schema(prop, defs) for name, prop in node['properties'].items()}
+        schema['required'] = node.get('required', [])
+    elif node['type'] == 'array':
+        schema['items'] = _gemini_schema(node['items'], defs)
+    return schema
+
+def response_schema(fields: tuple = ANALYSIS_FIELDS, array: bool = False) -> dict:
+    """Gemini response_schema generated from AnalysisResult/FoodItem, limited to fields"""
+    model_schema = AnalysisResult.model_json_schema()
+    defs = model_schema.get('$defs', {})
+    properties = {}
+    for field in fields:
+        properties[field] = _gemini_schema(model_schema['properties'][field], defs)
+        if field in FIELD_RANGES:
+            low, high = FIELD_RANGES[field]
+            properties[field]['description'] = f"Between {low} and {high}"
+    schema = {'type': 'object', 'properties': properties, 'required': list(fields)}
+    return {'type': 'array', 'items': schema} if array else schema
+
+def response_config(fields: tuple = ANALYSIS_FIELDS, array: bool = False) -> dict:
+    """generation_config for JSON-mode replies matching response_schema"""
+    return {"response_mime_type": "application/json", "response_schema": response_schema(fields, array)}
+
+def _food_items(value) -> Optional[list]:
+    if not isinstance(value, list):
+        return None
+    items = []
+    for item in value:
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name'].strip():
+            return None
+        category = item.get('category')
+        items.append({'name': item['name'].strip(), 'category': category if isinstance(category, str) else None})
+    return items
+
+def _in_range(field: str, value):
+    low, high = FIELD_RANGES[field]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        return None
+    return round(value) if field == "estimated_calories" else float(value)
+
+def validate_analysis(data, fields: tuple = ANALYSIS_FIELDS) -> tuple:
+    """(valid field values, names of missing or invalid fields) for one analysis object"""
+    if not isinstance(data, dict):
+        return {}, list(fields)
+    values, invalid = {}, []
+    for field in fields:
+        value = _food_items(data.get(field)) if field == "food_items" else _in_range(field, data.get(field))
+        if value is None:
+            invalid.append(field)
+        else:
+            values[field] = value
+    return values, invalid
+
+def parse_analyses(text: str, count: Optional[int] = None, fields: tuple = ANALYSIS_FIELDS) -> Optional[list]:
+    """Validate a JSON-mode reply: [(values, invalid fields)] per analysis, None if it isn't JSON of that shape
+
+    count=None expects one object; otherwise an array of exactly count objects.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if count is None:
+        return [validate_analysis(data, fields)] if isinstance(data, dict) else None
+    if not isinstance(data, list) or len(data) != count:
+        return None
+    return [validate_analysis(item, fields) for item in data]
+
+def parse_reply(text: str, count: Optional[int] = None, fields: tuple = ANALYSIS_FIELDS) -> Optional[list]:
+    """parse_analyses, recording the parse outcome and every reason a reply was unusable"""
+    started = time.perf_counter()
+    parsed = parse_analyses(text, count, fields)
+    failed = parsed is None or any(invalid for _, invalid in parsed)
+    metrics.observe("json_parse", time.perf_counter() - started, "error" if failed else "ok")
+    if parsed is None:
+        metrics.add_parse_failure("response")
+    else:
+        for _, invalid in parsed:
+            for field in invalid:
+                metrics.add_parse_failure(field)
+    return parsed
+
+async def complete_analysis(model, values: dict, invalid: list, image: dict, ctx) -> dict:
+    """Re-ask model for only the fields that failed validation, keeping the valid ones; returns every field's value"""
+    for _ in range(ANALYSIS_FIELD_RETRIES):
+        if not invalid:
+            break
+        ctx.logger.warning(f"🔁 Re-requesting invalid fields: {', '.join(invalid)}")
+        prompt = f"""
+    Your previous analysis of this meal plate had missing or invalid values for: {', '.join(invalid)}.
+    Values already accepted: {json.dumps(values)}
+    
+    Look at the photo again and return JSON with only those fields.
+    """
+        with metrics.track("field_retry"):
+            response = await generate_content(model, [prompt, image], generation_config=response_config(tuple(invalid)))
+        parsed = parse_reply(response.text, fields=tuple(invalid))
+        if parsed:
+            retried, invalid = parsed[0]
+            values.update(retried)
+    
+    if invalid:
+        raise ValueError(f"Fields still invalid after retrying: {', '.join(invalid)}")
+    return values
@@ -0,0 +1,123 @@
+# analysis_sharding.py
+import bisect
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from uagents import Model
+from uagents.crypto import Identity
+from uagents.resolver import GlobalResolver, Resolver
+
+load_dotenv()
+
+# Live analysis worker processes behind the dispatcher (0 = single eating_support_agent, no dispatcher)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+# Worker i listens on ANALYSIS_WORKER_BASE_PORT + i
+ANALYSIS_WORKER_BASE_PORT = int(os.getenv("ANALYSIS_WORKER_BASE_PORT", "8100"))
+ANALYSIS_DISPATCHER_PORT = int(os.getenv("ANALYSIS_DISPATCHER_PORT", "8020"))
+# Host the dispatcher and workers reach each other on
+ANALYSIS_SHARD_HOST = os.getenv("ANALYSIS_SHARD_HOST", "127.0.0.1")
+# Workers heartbeat this often; a worker silent for WORKER_HEARTBEAT_TIMEOUT leaves the ring
+WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "5"))
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "20"))
+
+# Virtual nodes per worker; more nodes spread sessions more evenly
+HASH_RING_REPLICAS = 64
+
+DISPATCHER_SEED = "eating_support_dispatcher_seed_phrase"
+ANALYSIS_AGENT_SEED = "eating_disorder_support_seed_phrase"
+ANALYSIS_AGENT_PORT = 8000
+STORAGE_AGENT_SEED = "storage_agent_seed_phrase"
+STORAGE_AGENT_PORT = 8001
+
+# Resolve the pipeline's agents on ANALYSIS_SHARD_HOST instead of the Almanac (single-host runs, load tests)
+LOCAL_AGENT_NETWORK = os.getenv("LOCAL_AGENT_NETWORK", "").lower() in ("1", "true", "yes")
+
+def worker_seed(index: int) -> str:
+    return f"eating_disorder_support_seed_phrase_worker_{index}"
+
+def worker_port(index: int) -> int:
+    return ANALYSIS_WORKER_BASE_PORT + index
+
+def worker_endpoint(index: int) -> str:
+    return f"http://{ANALYSIS_SHARD_HOST}:{worker_port(index)}/submit"
+
+def worker_address(index: int) -> str:
+    """Agent address of worker i, derived from its seed like Agent(seed=...) does"""
+    return Identity.from_seed(worker_seed(index), 0).address
+
+DISPATCHER_ADDRESS = Identity.from_seed(DISPATCHER_SEED, 0).address
+# Same as test.py's analysis_agent.address, without constructing that Agent
+ANALYSIS_AGENT_ADDRESS = Identity.from_seed(ANALYSIS_AGENT_SEED, 0).address
+DISPATCHER_ENDPOINT = f"http://{ANALYSIS_SHARD_HOST}:{ANALYSIS_DISPATCHER_PORT}/submit"
+
+def local_agent_rules() -> Dict[str, str]:
+    """Local endpoints of the storage agent, analysis agent, dispatcher and workers"""
+    rules = {
+        Identity.from_seed(ANALYSIS_AGENT_SEED, 0).address: f"http://{ANALYSIS_SHARD_HOST}:{ANALYSIS_AGENT_PORT}/submit",
+        Identity.from_seed(STORAGE_AGENT_SEED, 0).address: f"http://{ANALYSIS_SHARD_HOST}:{STORAGE_AGENT_PORT}/submit",
+        DISPATCHER_ADDRESS: DISPATCHER_ENDPOINT
+    }
+    rules.update({worker_address(i): worker_endpoint(i) for i in range(ANALYSIS_WORKERS)})
+    return rules
+
+class WorkerHeartbeat(Model):
+    worker_index: int
+    in_flight: int
+    leaving: bool = False
+
+class HashRing:
+    """Consistent hash ring: adding or removing a node only moves the sessions on its arcs"""
+
+    def __init__(self, replicas: int = HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def add(self, node: str):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: str):
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Node owning key: the first ring point clockwise from its hash"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    @property
+    def nodes(self) -> set:
+        return set(self._owners.values())
+
+class LocalFirstResolver(Resolver):
+    """Resolve known local agents from fixed endpoints, everything else via the Almanac"""
+
+    def __init__(self, rules: Dict[str, str]):
+        self._rules = rules
+        self._fallback = GlobalResolver()
+
+    async def resolve(self, destination: str):
+        if destination in self._rules:
+            return destination, [self._rules[destination]]
+        return await self._fallback.resolve(destination)
+
+def agent_resolver(rules: Optional[Dict[str, str]] = None) -> Optional[Resolver]:
+    """Resolver for the given fixed endpoints (plus the local pipeline with LOCAL_AGENT_NETWORK); None = Almanac"""
+    if LOCAL_AGENT_NETWORK:
+        rules = dict(rules or {}, **local_agent_rules())
+    return LocalFirstResolver(rules) if rules else None
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark the binary depth-grid format against JSON float lists
+Reports payload size and parse time per grid
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from depth_format import encode_depth, decode_depth, CODECS, ZSTD_AVAILABLE
+
+def synthetic_plate(width: int, height: int) -> np.ndarray:
+    """Table plane ~0.6 m away with a dome of food in the middle and sensor noise"""
+    ys, xs = np.mgrid[0:height, 0:width]
+    table = 0.6 + 0.0005 * xs + 0.0003 * ys
+    radius = np.hypot(xs - width / 2, ys - height / 2) / (min(width, height) / 3)
+    food = np.clip(1 - radius ** 2, 0, None) * 0.04
+    noise = np.random.default_rng(0).normal(0, 0.002, (height, width))
+    return (table - food + noise).astype(np.float32)
+
+def time_call(fn, *args, repeats: int = 200):
+    """Best-of-N wall time in microseconds and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, (time.perf_counter() - started) * 1e6)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark depth grid encodings")
+    parser.add_argument("--sizes", default="64x64,320x240,640x480")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    codecs = [codec for codec in CODECS.values() if codec != 'zstd' or ZSTD_AVAILABLE]
+
+    print("🧪 Depth grid format benchmark")
+    print("=" * 78)
+    print(f"{'grid':<10}{'format':<22}{'bytes':>12}{'ratio':>10}{'parse µs':>12}")
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.split('x'))
+        grid = synthetic_plate(width, height)
+
+        json_payload = json.dumps({"width": width, "height": height, "values": grid.ravel().tolist()}).encode()
+        json_us, _ = time_call(json.loads, json_payload, repeats=max(1, args.repeats // 10))
+        print(f"{size:<10}{'json':<22}{len(json_payload):>12}{1.0:>10.1f}{json_us:>12.1f}")
+
+        for dtype in ('uint16_mm', 'float16'):
+            for codec in codecs:
+                payload = encode_depth(grid, width, height, dtype=dtype, codec=codec)
+                parse_us, _ = time_call(decode_depth, payload, repeats=args.repeats)
+                ratio = len(json_payload) / len(payload)
+                print(f"{'':<10}{dtype + '/' + codec:<22}{len(payload):>12}{ratio:>10.1f}{parse_us:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,13 @@ import requests
 from PIL import Image
 import io
 import os
-from supabase import create_client
+from storage_backend import create_storage_client, is_file_url, file_url_path, read_object
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Initialize Supabase
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+supabase = create_storage_client()
 
 def debug_image_processing():
     """Debug image processing step by step"""
@@ -30,20 +30,26 @@ def debug_image_processing():
         
         # Step 1: Download image
         print("\n1️⃣ Downloading image...")
-        download_response = requests.get(image_url, timeout=30)
-        print(f"   Status code: {download_response.status_code}")
-        print(f"   Content type: {download_response.headers.get('content-type', 'unknown')}")
-        print(f"   Content length: {len(download_response.content)} bytes")
-        
-        if download_response.status_code != 200:
-            print("❌ Download failed")
-            return
+        if is_file_url(image_url):
+            # STORAGE_BACKEND=local stores file:// URLs, which requests can't fetch
+            content = read_object(file_url_path(image_url))
+            print(f"   Local file: {file_url_path(image_url)}")
+        else:
+            download_response = requests.get(image_url, timeout=30)
+            print(f"   Status code: {download_response.status_code}")
+            print(f"   Content type: {download_response.headers.get('content-type', 'unknown')}")
+            
+            if download_response.status_code != 200:
+                print("❌ Download failed")
+                return
+            content = download_response.content
+        print(f"   Content length: {len(content)} bytes")
         
         # Step 2: Check content
         print("\n2️⃣ Checking content...")
-        content = download_response.content
         print(f"   First 20 bytes: {content[:20]}")
-        print(f"   Is JPEG header? {content.startswith(b'\\xff\\xd8\\xff')}")
+        is_jpeg = content.startswith(b'\xff\xd8\xff')
+        print(f"   Is JPEG header? {is_jpeg}")
         
         # Step 3: Try to open with PIL
         print("\n3️⃣ Opening with PIL...")
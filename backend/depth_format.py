@@ -0,0 +1,89 @@
+# depth_format.py
+import struct
+import zlib
+
+import numpy as np
+
+# Optional zstd support (pip install zstandard); zlib is always available
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DEPTH_MAGIC = b'DPTH'
+DEPTH_VERSION = 1
+DEPTH_CONTENT_TYPE = 'application/x-depth-grid'
+
+# magic, version, dtype, codec, reserved, width, height, scale (metres per stored unit)
+HEADER = struct.Struct('<4sBBBBHHf')
+
+DTYPES = {
+    1: ('float16', np.dtype('<f2')),   # metres
+    2: ('uint16_mm', np.dtype('<u2')), # millimetres, 0 = no reading
+}
+DTYPE_CODES = {name: code for code, (name, _) in DTYPES.items()}
+CODECS = {0: 'none', 1: 'zlib', 2: 'zstd'}
+CODEC_CODES = {name: code for code, name in CODECS.items()}
+
+DEFAULT_CODEC = 'zstd' if ZSTD_AVAILABLE else 'zlib'
+
+def encode_depth(values, width: int, height: int, dtype: str = 'uint16_mm', codec: str = DEFAULT_CODEC) -> bytes:
+    """Pack a depth grid in metres into the compact binary format"""
+    metres = np.asarray(values, dtype=np.float32).reshape(height * width)
+    valid = np.isfinite(metres) & (metres > 0)
+
+    if dtype == 'uint16_mm':
+        scale = 0.001
+        grid = np.where(valid, np.clip(np.rint(metres * 1000), 1, 65535), 0).astype('<u2')
+    elif dtype == 'float16':
+        scale = 1.0
+        grid = np.where(valid, metres, 0).astype('<f2')
+    else:
+        raise ValueError(f"Unknown depth dtype: {dtype}")
+
+    payload = grid.tobytes()
+    if codec == 'zlib':
+        payload = zlib.compress(payload, 6)
+    elif codec == 'zstd':
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    elif codec != 'none':
+        raise ValueError(f"Unknown depth codec: {codec}")
+
+    header = HEADER.pack(DEPTH_MAGIC, DEPTH_VERSION, DTYPE_CODES[dtype], CODEC_CODES[codec], 0, width, height, scale)
+    return header + payload
+
+def is_depth_grid(data: bytes) -> bool:
+    return data[:4] == DEPTH_MAGIC
+
+def decode_depth(data: bytes) -> dict:
+    """Unpack a depth grid; 'values' is a flat read-only view (no per-element parsing)"""
+    magic, version, dtype_code, codec_code, _, width, height, scale = HEADER.unpack_from(data)
+    if magic != DEPTH_MAGIC or version != DEPTH_VERSION:
+        raise ValueError("Not a depth grid")
+
+    payload = memoryview(data)[HEADER.size:]
+    codec = CODECS[codec_code]
+    if codec == 'zlib':
+        payload = zlib.decompress(payload)
+    elif codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd depth grid received but zstandard is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+
+    name, np_dtype = DTYPES[dtype_code]
+    values = np.frombuffer(payload, dtype=np_dtype, count=width * height)
+    return {
+        'width': width,
+        'height': height,
+        'values': values,
+        'dtype': name,
+        'scale': scale
+    }
+
+def depth_in_metres(depth_data: dict) -> np.ndarray:
+    """Depth grid as a (height, width) float32 array in metres, NaN where there is no reading"""
+    values = np.asarray(depth_data['values'])
+    metres = values.astype(np.float32) * np.float32(depth_data.get('scale', 1.0))
+    metres[values == 0] = np.nan
+    return metres.reshape(depth_data['height'], depth_data['width'])
@@ -4,6 +4,7 @@ Eating Disorder Support Agent - Proper Chat Protocol Implementation
 Based on Fetch.ai Innovation Lab documentation
 """
 
+import asyncio
 import os
 import json
 import base64
@@ -13,9 +14,10 @@ from uuid import uuid4
 from typing import Any
 
 import requests
-from PIL import Image
-import io
-from supabase import create_client
+from image_preprocess import prepare_image
+from meal_images_query import DEFAULT_PATIENT_ID
+from meal_image_store import store_meal_image
+from storage_backend import create_storage_client, STORAGE_BACKEND
 from dotenv import load_dotenv
 
 from uagents import Agent, Context, Protocol
@@ -39,13 +41,14 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not all([SUPABASE_URL, SUPABASE_KEY, GEMINI_API_KEY]):
+if not GEMINI_API_KEY or (STORAGE_BACKEND == "supabase" and not all([SUPABASE_URL, SUPABASE_KEY])):
     raise ValueError("Missing required environment variables: SUPABASE_URL, SUPABASE_KEY, GEMINI_API_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = create_storage_client()
 
 # Configure Gemini
 import google.generativeai as genai
+from gemini_client import generate_content
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
@@ -71,47 +74,21 @@ def create_text_chat(text: str) -> ChatMessage:
 
 # Removed metadata function - not needed for basic chat protocol
 
-def upload_image_to_supabase(image_base64: str, session_id: str, frame_id: str) -> str:
+def upload_image_to_supabase(image_base64: str, session_id: str, frame_id: str,
+                             patient_id: str = DEFAULT_PATIENT_ID) -> str:
     """Upload image to Supabase storage"""
     try:
         image_bytes = base64.b64decode(image_base64)
-        timestamp = int(time.time())
-        
-        # Detect image format
-        if image_bytes.startswith(b'\x89PNG'):
-            file_path = f"{session_id}/{frame_id}_{timestamp}.png"
-        elif image_bytes.startswith(b'\xff\xd8\xff'):
-            file_path = f"{session_id}/{frame_id}_{timestamp}.jpg"
-        else:
-            file_path = f"{session_id}/{frame_id}_{timestamp}.png"
-        
-        # Upload to Supabase
-        supabase.storage.from_('meals').upload(file_path, image_bytes)
-        url = supabase.storage.from_('meals').get_public_url(file_path)
-        
-        # Store metadata
-        supabase.table('meal_images').insert({
-            'session_id': session_id,
-            'frame_id': frame_id,
-            'file_path': file_path,
-            'url': url,
-            'uploaded_at': timestamp
-        }).execute()
-        
-        return url
+        return store_meal_image(supabase, image_bytes, session_id, frame_id, int(time.time()), patient_id)
     except Exception as e:
         print(f"Error uploading image: {e}")
         return None
 
-def analyze_food_with_gemini(image_data: bytes, user_query: str = "Analyze this meal") -> str:
+async def analyze_food_with_gemini(image_data: bytes, user_query: str = "Analyze this meal") -> str:
     """Analyze food using Gemini Vision API"""
     try:
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert PNG to RGB if needed
-        if image.mode == 'RGBA':
-            image = image.convert('RGB')
+        # Downscale and re-encode as JPEG (CPU-bound, so off the event loop)
+        image = await asyncio.to_thread(prepare_image, image_data)
         
         # Analyze with Gemini
         prompt = f"""
@@ -126,7 +103,7 @@ def analyze_food_with_gemini(image_data: bytes, user_query: str = "Analyze this
         Provide a helpful, supportive response for someone tracking their eating habits.
         """
         
-        response = model.generate_content([prompt, image])
+        response = await generate_content(model, [prompt, image])
         return response.text
         
     except Exception as e:
@@ -0,0 +1,76 @@
+# frame_dedupe.py
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Frames within this many differing dHash bits of the last analyzed frame are treated as unchanged
+DEDUPE_HAMMING_THRESHOLD = int(os.getenv("DEDUPE_HAMMING_THRESHOLD", "4"))
+# Sessions remembered at once (least recently active sessions are forgotten first)
+DEDUPE_MAX_SESSIONS = int(os.getenv("DEDUPE_MAX_SESSIONS", "1000"))
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a tiny grayscale thumbnail"""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Decode JPEGs at the smallest DCT scale that still covers the thumbnail
+    image.draft('L', (hash_size * 4, hash_size * 4))
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class FrameDeduper:
+    """Per-session index of the last analyzed frame hash and its analysis result"""
+
+    def __init__(self, threshold: int = DEDUPE_HAMMING_THRESHOLD, max_sessions: int = DEDUPE_MAX_SESSIONS):
+        self.threshold = threshold
+        self.max_sessions = max_sessions
+        self.frames_seen = 0
+        self.frames_suppressed = 0
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, session_id: str, frame_hash: Optional[int]) -> Optional[Any]:
+        """Return the previous result if this frame is visually unchanged, else None"""
+        with self._lock:
+            self.frames_seen += 1
+            entry = self._sessions.get(session_id)
+            if entry is None or frame_hash is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            if hamming_distance(entry['hash'], frame_hash) > self.threshold:
+                return None
+            self.frames_suppressed += 1
+            return entry['result']
+
+    def record(self, session_id: str, frame_hash: Optional[int], result: Any):
+        """Remember the hash and result of the last frame that was actually analyzed"""
+        if frame_hash is None:
+            return
+        with self._lock:
+            self._sessions[session_id] = {'hash': frame_hash, 'result': result}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "frames_seen": self.frames_seen,
+                "frames_suppressed": self.frames_suppressed,
+                "suppressed_rate": round(self.frames_suppressed / self.frames_seen, 4) if self.frames_seen else 0.0,
+                "sessions_tracked": len(self._sessions)
+            }
+
+# Shared deduper instance
+frame_deduper = FrameDeduper()
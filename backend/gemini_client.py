@@ -0,0 +1,173 @@
+# gemini_client.py
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from metrics import metrics
+
+load_dotenv()
+
+# Maximum Gemini calls in flight per process
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# Seconds before the SDK itself abandons a request (a cancelled caller cannot stop the blocking call)
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60"))
+
+# Number of recent samples kept for percentiles
+STATS_WINDOW = 1000
+
+# Local Gemini stand-in for load tests: recorded responses after a lognormal delay, no API calls
+GEMINI_STUB = os.getenv("GEMINI_STUB", "").lower() in ("1", "true", "yes")
+GEMINI_STUB_RESPONSES = os.getenv("GEMINI_STUB_RESPONSES")
+GEMINI_STUB_LATENCY_MS = float(os.getenv("GEMINI_STUB_LATENCY_MS", "1500"))
+GEMINI_STUB_LATENCY_SIGMA = float(os.getenv("GEMINI_STUB_LATENCY_SIGMA", "0.5"))
+GEMINI_STUB_ERROR_RATE = float(os.getenv("GEMINI_STUB_ERROR_RATE", "0"))
+# Append real response texts here (JSONL) to replay them later through GEMINI_STUB_RESPONSES
+GEMINI_RECORD_PATH = os.getenv("GEMINI_RECORD_PATH")
+
+# Served when no recording is given
+SYNTHETIC_ANALYSES = [
+    {"food_items": [{"name": "rice", "category": "carb"}, {"name": "chicken", "category": "protein"}],
+     "remaining_percent": 70.0, "consumed_since_last": 10.0, "estimated_calories": 120, "confidence": 0.8},
+    {"food_items": [{"name": "salad", "category": "vegetable"}],
+     "remaining_percent": 45.0, "consumed_since_last": 15.0, "estimated_calories": 60, "confidence": 0.75},
+    {"food_items": [{"name": "pasta", "category": "carb"}, {"name": "broccoli", "category": "vegetable"}],
+     "remaining_percent": 20.0, "consumed_since_last": 20.0, "estimated_calories": 210, "confidence": 0.85}
+]
+
+class LatencyStats:
+    """Running count/mean/max plus percentiles over a recent window (seconds)"""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, maximum = self.count, self.total, self.max
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 4) if recent else 0.0
+
+        return {
+            "count": count,
+            "mean": round(total / count, 4) if count else 0.0,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": round(maximum, 4)
+        }
+
+queue_wait_stats = LatencyStats()
+call_latency_stats = LatencyStats()
+
+# Dedicated threads so blocking SDK calls never run on the agent's event loop
+_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+def load_recorded_analyses(path: str) -> list:
+    """Analysis objects from a GEMINI_RECORD_PATH file (batch replies contribute each element)"""
+    analyses = []
+    with open(path) as f:
+        for line in f:
+            try:
+                text = json.loads(line)['text']
+                match = re.search(r'\[.*\]|\{.*\}', text, re.DOTALL)
+                data = json.loads(match.group()) if match else None
+            except (ValueError, KeyError):
+                continue
+            analyses.extend(item for item in (data if isinstance(data, list) else [data]) if isinstance(item, dict))
+    return analyses
+
+_stub_analyses = (load_recorded_analyses(GEMINI_STUB_RESPONSES) if GEMINI_STUB and GEMINI_STUB_RESPONSES else None) \
+    or SYNTHETIC_ANALYSES
+
+async def stub_generate_content(contents) -> StubResponse:
+    """Answer like Gemini would: one analysis per image, an array for multi-image requests"""
+    await asyncio.sleep(random.lognormvariate(0, GEMINI_STUB_LATENCY_SIGMA) * GEMINI_STUB_LATENCY_MS / 1000)
+    if random.random() < GEMINI_STUB_ERROR_RATE:
+        raise RuntimeError("Gemini stub: injected error")
+    images = sum(1 for part in contents if isinstance(part, dict) and 'mime_type' in part)
+    analyses = [random.choice(_stub_analyses) for _ in range(max(1, images))]
+    return StubResponse(json.dumps(analyses if images > 1 else analyses[0]))
+
+_record_lock = threading.Lock()
+
+def record_response(response):
+    try:
+        text = response.text
+    except Exception:
+        return  # Blocked or empty replies have no text to replay
+    with _record_lock, open(GEMINI_RECORD_PATH, 'a') as f:
+        f.write(json.dumps({'text': text}) + "\n")
+
+def _release_when_done(call: asyncio.Future):
+    # The slot is only free once the thread is; a caller cancelled mid-call leaves its result unretrieved
+    if not call.cancelled():
+        call.exception()
+    _semaphore.release()
+
+async def generate_content(model, contents, **kwargs):
+    """Run model.generate_content off the event loop behind the concurrency limit
+
+    The slot stays taken until the SDK call returns, even if the caller is cancelled (e.g. by
+    asyncio.wait_for), so abandoned calls never push the real concurrency past the limit.
+    """
+    enqueued = time.perf_counter()
+    await _semaphore.acquire()
+    started = time.perf_counter()
+    queue_wait_stats.observe(started - enqueued)
+    metrics.observe("gemini_queue", started - enqueued)
+    outcome = "error"
+    call = None
+    try:
+        if GEMINI_STUB:
+            response = await stub_generate_content(contents)
+        else:
+            kwargs.setdefault("request_options", {"timeout": GEMINI_REQUEST_TIMEOUT})
+            call = asyncio.get_running_loop().run_in_executor(
+                _executor, functools.partial(model.generate_content, contents, **kwargs)
+            )
+            response = await asyncio.shield(call)
+            if GEMINI_RECORD_PATH:
+                record_response(response)
+        outcome = "ok"
+        return response
+    finally:
+        call_latency_stats.observe(time.perf_counter() - started)
+        metrics.observe("gemini_call", time.perf_counter() - started, outcome)
+        if call is None or call.done():
+            _semaphore.release()
+        else:
+            call.add_done_callback(_release_when_done)
+
+def gemini_stats() -> dict:
+    """Queue-wait and call-latency summaries, reported separately"""
+    return {
+        "max_concurrency": GEMINI_MAX_CONCURRENCY,
+        "stub": GEMINI_STUB,
+        "queue_wait_seconds": queue_wait_stats.snapshot(),
+        "call_latency_seconds": call_latency_stats.snapshot()
+    }
@@ -0,0 +1,78 @@
+# http_client.py
+import asyncio
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from storage_backend import STORAGE_BACKEND, file_url_path, is_file_url, read_object
+
+load_dotenv()
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "16"))
+HTTP_MAX_DOWNLOAD_BYTES = int(os.getenv("HTTP_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class DownloadTooLarge(Exception):
+    """Raised when a response body exceeds the configured size cap"""
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client (created on first use inside the agent's event loop)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            ),
+            follow_redirects=True
+        )
+    return _client
+
+async def fetch_bytes(url: str, max_bytes: int = HTTP_MAX_DOWNLOAD_BYTES) -> bytes:
+    """Stream a URL into memory, failing fast once it grows past max_bytes"""
+    if is_file_url(url):
+        # Objects from the local storage backend: no HTTP round trip. Only that backend hands out
+        # file:// URLs, and only for files under its root, so anything else is refused
+        if STORAGE_BACKEND != "local":
+            raise ValueError(f"file:// URLs are only accepted with STORAGE_BACKEND=local: {url}")
+        path = file_url_path(url)
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            raise DownloadTooLarge(f"{url} is {size} bytes (limit {max_bytes})")
+        return await asyncio.to_thread(read_object, path)
+
+    async with get_client().stream("GET", url) as response:
+        response.raise_for_status()
+
+        declared = response.headers.get("content-length")
+        if declared and int(declared) > max_bytes:
+            raise DownloadTooLarge(f"{url} is {declared} bytes (limit {max_bytes})")
+
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) > max_bytes:
+                raise DownloadTooLarge(f"{url} exceeded {max_bytes} bytes")
+        return bytes(body)
+
+async def close_client():
+    """Close pooled connections (call on agent shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,38 @@
+# http_sidecar.py
+import os
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from metrics import metrics, CONTENT_TYPE
+
+load_dotenv()
+
+# uagents REST handlers only speak JSON models, so raw bodies, streaming
+# responses and custom headers are served by a small aiohttp app that runs
+# on the agent's own event loop next to it
+SIDECAR_HOST = os.getenv("SIDECAR_HOST", "0.0.0.0")
+SIDECAR_MAX_BODY_BYTES = int(os.getenv("SIDECAR_MAX_BODY_BYTES", str(20 * 1024 * 1024)))
+# Agents without a sidecar of their own serve /metrics on their agent port plus this offset
+METRICS_PORT_OFFSET = int(os.getenv("METRICS_PORT_OFFSET", "1000"))
+
+async def start_sidecar(routes: list, port: int, host: str = SIDECAR_HOST,
+                        max_body_bytes: int = SIDECAR_MAX_BODY_BYTES) -> web.AppRunner:
+    """Start an aiohttp server for the given routes on the running event loop"""
+    app = web.Application(client_max_size=max_body_bytes)
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def get_metrics(request: web.Request) -> web.Response:
+    """Stage latency histograms and byte counters for Prometheus to scrape"""
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+def metrics_route():
+    return web.get('/metrics', get_metrics)
+
+async def start_metrics_sidecar(agent_port: int) -> web.AppRunner:
+    """Serve only /metrics, next to an agent that has no other sidecar"""
+    return await start_sidecar([metrics_route()], agent_port + METRICS_PORT_OFFSET)
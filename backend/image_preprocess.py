@@ -0,0 +1,37 @@
+# image_preprocess.py
+import io
+import os
+
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Longest side sent to Gemini; food recognition does not need full sensor resolution
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+def prepare_image(image_bytes: bytes, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY) -> dict:
+    """Decode at reduced resolution, shrink to max_side and re-encode as JPEG.
+
+    Returns an inline blob ({'mime_type', 'data'}) that can be passed to
+    model.generate_content in place of a PIL image.
+    """
+    # Image.open only reads the header, so small JPEGs are sent untouched without decoding
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG' and image.mode == 'RGB' and max(image.size) <= max_side:
+        return {'mime_type': 'image/jpeg', 'data': image_bytes}
+
+    # JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale (DCT scaling),
+    # so large frames are never fully materialized
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_side, max_side))
+
+    # Convert PNG to RGB if needed (PNG might be RGBA)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality, optimize=True)
+    return {'mime_type': 'image/jpeg', 'data': output.getvalue()}
@@ -0,0 +1,112 @@
+# ingest_queue.py
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Frames waiting per session behind the one being analyzed; a newer frame replaces the oldest waiting one
+INGEST_QUEUE_DEPTH = max(1, int(os.getenv("INGEST_QUEUE_DEPTH", "1")))
+# Sessions with a frame in flight or waiting at once; frames for further sessions are dropped
+INGEST_MAX_SESSIONS = int(os.getenv("INGEST_MAX_SESSIONS", "64"))
+
+class IngestRejected(Exception):
+    """The agent is at capacity and did not accept the frame"""
+
+class IngestQueue:
+    """Bounded per-session ingest: one frame in flight per session, newer frames coalesce queued ones
+
+    A frame replaced while waiting is never analyzed; its caller gets the result of the
+    frame that replaced it, so every reply reflects the newest plate state and no caller
+    waits longer than roughly two analyses.
+    """
+
+    def __init__(self, depth: int = INGEST_QUEUE_DEPTH, max_sessions: int = INGEST_MAX_SESSIONS):
+        self.depth = depth
+        self.max_sessions = max_sessions
+        self.admitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.completed = 0
+        self.in_flight = 0
+        # session_id -> deque of (process, future) waiting behind the frame in flight
+        self._sessions = {}
+        # Running drain tasks; the event loop only keeps weak references to tasks
+        self._drains = set()
+
+    async def submit(self, session_id: str, process: Callable[[], Awaitable[Any]]) -> Any:
+        """Queue process() as the session's newest frame and wait for the result that answers it"""
+        queue = self._sessions.get(session_id)
+        if queue is None:
+            if len(self._sessions) >= self.max_sessions:
+                self.dropped += 1
+                raise IngestRejected(f"{len(self._sessions)} sessions already in progress")
+            queue = self._sessions[session_id] = deque()
+            drain = asyncio.create_task(self._drain(session_id, queue))
+            self._drains.add(drain)
+            drain.add_done_callback(self._drains.discard)
+
+        future = asyncio.get_running_loop().create_future()
+        if len(queue) >= self.depth:
+            # Last write wins: the oldest waiting frame is answered with this frame's result
+            _, superseded = queue.popleft()
+            future.add_done_callback(lambda done, superseded=superseded: _copy_result(done, superseded))
+            self.coalesced += 1
+        queue.append((process, future))
+        self.admitted += 1
+
+        # A caller that goes away must not cancel a result other callers share
+        return await asyncio.shield(future)
+
+    async def _drain(self, session_id: str, queue: deque):
+        # Starts once submit() has queued the first frame and awaits it
+        future = None
+        try:
+            while queue:
+                process, future = queue.popleft()
+                self.in_flight += 1
+                try:
+                    result = await process()
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    self.in_flight -= 1
+                    self.completed += 1
+        finally:
+            del self._sessions[session_id]
+            # Cancelled mid-frame (e.g. at shutdown): nothing will answer the frame in flight or the waiting ones
+            for _, waiting in ([(None, future)] if future else []) + list(queue):
+                if not waiting.done():
+                    waiting.cancel()
+            queue.clear()
+
+    def stats(self) -> dict:
+        return {
+            "sessions_active": len(self._sessions),
+            "in_flight": self.in_flight,
+            "queued": sum(len(queue) for queue in self._sessions.values()),
+            "admitted": self.admitted,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "queue_depth": self.depth,
+            "max_sessions": self.max_sessions
+        }
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+# Shared queue instance
+ingest_queue = IngestQueue()
@@ -0,0 +1,115 @@
+# job_queue.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "analysis_jobs.db")
+# Finished (done/failed) jobs are deleted after this many seconds
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+class JobQueue:
+    """Durable FIFO of analysis jobs in SQLite; survives agent restarts"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, retention_seconds: int = JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._db.commit()
+
+    def submit(self, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (job_id, payload, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, json.dumps(payload), time.time())
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """Atomically move the oldest queued job to running and return it"""
+        with self._lock:
+            row = self._db.execute("""
+                UPDATE jobs SET status = 'running', started_at = ?
+                WHERE job_id = (SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1)
+                RETURNING job_id, payload
+            """, (time.time(),)).fetchone()
+            self._db.commit()
+        return {'job_id': row['job_id'], 'payload': json.loads(row['payload'])} if row else None
+
+    def update_progress(self, job_id: str, progress: dict):
+        self._set(job_id, "progress = ?", json.dumps(progress))
+
+    def complete(self, job_id: str, result: dict):
+        self._set(job_id, "status = 'done', result = ?, finished_at = ?", json.dumps(result), time.time())
+
+    def fail(self, job_id: str, error: str):
+        self._set(job_id, "status = 'failed', error = ?, finished_at = ?", error, time.time())
+
+    def _set(self, job_id: str, assignments: str, *values):
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values, job_id))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ('payload', 'progress', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def requeue_running(self) -> int:
+        """Put jobs interrupted by a restart back in the queue"""
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def purge(self) -> int:
+        """Delete finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            count = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+# Shared queue instance
+job_queue = JobQueue()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: storage agent → eating_support_agent → nutrition_analysis_agent
+Replays frames into the binary ingest endpoint at a fixed rate and polls patient reports,
+then reports throughput, p50/p95/p99 latency and errors per stage. With --spawn the agents
+run against the local storage backend and the Gemini stand-in, so no quota is used.
+"""
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from PIL import Image, ImageDraw
+
+from analysis_sharding import ANALYSIS_AGENT_PORT
+
+AGENT_SCRIPTS = [
+    ("storage", "storage_agent.py"),
+    ("analysis", "test.py"),
+    ("nutrition", "nutrition_analysis_agent.py")
+]
+
+# Result names the pipeline uses for failures, by the stage that produced them
+ERROR_STAGES = {
+    "upload_failed": "storage",
+    "overloaded": "admission",
+    "analysis_failed": "analysis"
+}
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class StageStats:
+    """Latencies of successful requests and error counts by kind"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def summary(self, elapsed: float) -> dict:
+        requests = len(self.latencies) + sum(self.errors.values())
+        return {
+            "requests": requests,
+            "ok": len(self.latencies),
+            "errors": dict(self.errors),
+            "error_rate": round(sum(self.errors.values()) / requests, 4) if requests else 0.0,
+            "throughput_per_s": round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(self.latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 1),
+            "max_ms": round(max(self.latencies, default=0.0) * 1000, 1)
+        }
+
+def synthetic_frames(count: int = 12, size: tuple = (480, 360)) -> list:
+    """A plate emptying over `count` frames; every frame differs enough to pass frame dedupe"""
+    frames = []
+    rng = random.Random(42)
+    for index in range(count):
+        image = Image.new('RGB', size, (235, 230, 220))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((40, 30, size[0] - 40, size[1] - 30), fill=(250, 250, 250), outline=(200, 200, 200))
+        remaining = 1.0 - index / count
+        for _ in range(int(40 * remaining) + 3):
+            x, y = rng.randint(90, size[0] - 130), rng.randint(70, size[1] - 110)
+            r = rng.randint(10, 40)
+            draw.ellipse((x, y, x + r, y + r), fill=(rng.randint(60, 220), rng.randint(60, 200), rng.randint(20, 120)))
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        frames.append(output.getvalue())
+    return frames
+
+def recorded_frames(folder: str) -> list:
+    paths = sorted(p for p in glob.glob(os.path.join(folder, '*'))
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+async def send_frame(client: httpx.AsyncClient, ingest_url: str, frame: bytes, session_id: str, frame_id: str,
+                     patient_id: str, stats: StageStats):
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{ingest_url}/ingest",
+            params={'session_id': session_id, 'frame_id': frame_id, 'user_id': patient_id},
+            content=frame,
+            headers={'Content-Type': 'image/jpeg'}
+        )
+    except httpx.HTTPError as e:
+        stats.errors[f"transport:{type(e).__name__}"] += 1
+        return
+    elapsed = time.perf_counter() - started
+
+    if response.status_code == 503:
+        stats.errors["admission:rejected"] += 1
+        return
+    if response.status_code != 200:
+        stats.errors[f"ingest:http_{response.status_code}"] += 1
+        return
+    result = response.json()
+    items = result.get('food_items') or [{}]
+    name = items[0].get('name') if isinstance(items[0], dict) else None
+    if name in ERROR_STAGES:
+        stats.errors[f"{ERROR_STAGES[name]}:{name}"] += 1
+    elif result.get('confidence', 0) == 0:
+        # The analysis agent's fallback when Gemini fails or returns unparseable output
+        stats.errors["analysis:gemini_fallback"] += 1
+    else:
+        stats.latencies.append(elapsed)
+
+async def poll_reports(client: httpx.AsyncClient, report_url: str, patient_id: str, interval: float,
+                       stats: StageStats, stop: asyncio.Event):
+    """Ask for the patient's report every `interval` seconds while frames stream in"""
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        started = time.perf_counter()
+        try:
+            response = await client.get(f"{report_url}/report", params={'patient_id': patient_id})
+        except httpx.HTTPError as e:
+            stats.errors[f"transport:{type(e).__name__}"] += 1
+            continue
+        if response.status_code in (200, 304):
+            stats.latencies.append(time.perf_counter() - started)
+        else:
+            stats.errors[f"report:http_{response.status_code}"] += 1
+
+async def run_step(args, rate: float, frames: list, step: int) -> dict:
+    """Offer `rate` frames/s for args.duration seconds (open loop) and collect stage stats"""
+    frame_stats, report_stats = StageStats(), StageStats()
+    sessions = [f"load_{int(time.time())}_{step}_{i}" for i in range(args.sessions)]
+    total = int(rate * args.duration)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        stop = asyncio.Event()
+        reporter = asyncio.create_task(
+            poll_reports(client, args.report_url, args.patient_id, args.report_every, report_stats, stop)
+        ) if args.report_every > 0 else None
+
+        tasks = []
+        max_lag = 0.0
+        started = time.perf_counter()
+        for index in range(total):
+            # Scheduled send times do not depend on replies, so a slow pipeline shows up as latency
+            due = started + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            max_lag = max(max_lag, -delay)
+            session = index % len(sessions)
+            frame = frames[(index // len(sessions)) % len(frames)]
+            tasks.append(asyncio.create_task(send_frame(
+                client, args.ingest_url, frame, sessions[session], f"frame_{index}", args.patient_id, frame_stats
+            )))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        if reporter:
+            await reporter
+
+    return {
+        "offered_rate": rate,
+        "elapsed_s": round(elapsed, 2),
+        "generator_max_lag_ms": round(max_lag * 1000, 1),
+        "frames": frame_stats.summary(elapsed),
+        "reports": report_stats.summary(elapsed)
+    }
+
+async def agent_snapshots(args) -> dict:
+    """The agents' own counters after the run (missing endpoints are skipped)"""
+    urls = {
+        "ingest": f"{args.ingest_url}/ingest_stats",
+        "gemini": f"{args.nutrition_url}/gemini_stats",
+        "result_cache": f"{args.nutrition_url}/cache_stats"
+    }
+    snapshots = {}
+    async with httpx.AsyncClient(timeout=5) as client:
+        for name, url in urls.items():
+            try:
+                snapshots[name] = (await client.get(url)).json()
+            except Exception:
+                pass
+    return snapshots
+
+def spawn_agents(args, workdir: str) -> list:
+    """Start the pipeline against local storage and the Gemini stand-in, state kept in workdir"""
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="local",
+        LOCAL_STORAGE_PATH=os.path.join(workdir, "storage"),
+        LOCAL_AGENT_NETWORK="1",
+        GEMINI_STUB="1",
+        GEMINI_STUB_LATENCY_MS=str(args.gemini_latency_ms),
+        GEMINI_STUB_LATENCY_SIGMA=str(args.gemini_sigma),
+        GEMINI_STUB_ERROR_RATE=str(args.gemini_error_rate),
+        SESSION_STORE_PATH=os.path.join(workdir, "sessions.db"),
+        RESULT_CACHE_PATH=os.path.join(workdir, "analysis_cache.db"),
+        REPORT_STATE_PATH=os.path.join(workdir, "report_state.db"),
+        JOB_QUEUE_PATH=os.path.join(workdir, "analysis_jobs.db")
+    )
+    env.setdefault("GEMINI_API_KEY", "stub")
+    if args.gemini_responses:
+        env["GEMINI_STUB_RESPONSES"] = os.path.abspath(args.gemini_responses)
+
+    backend = os.path.dirname(os.path.abspath(__file__))
+    processes = []
+    for name, script in AGENT_SCRIPTS:
+        log = open(os.path.join(workdir, f"{name}.log"), 'w')
+        print(f"🚀 Starting {name} agent (log: {log.name})")
+        processes.append(subprocess.Popen([sys.executable, script], cwd=backend, env=env,
+                                          stdout=log, stderr=subprocess.STDOUT))
+    return processes
+
+async def wait_until_ready(urls: list, timeout: float = 90):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        for url in urls:
+            while True:
+                try:
+                    await client.get(url)
+                    break
+                except httpx.HTTPError:
+                    if time.time() > deadline:
+                        raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+                    await asyncio.sleep(0.5)
+
+def print_step(result: dict):
+    frames, reports = result['frames'], result['reports']
+    print(f"\n📈 Offered {result['offered_rate']:g} frames/s for {result['elapsed_s']}s "
+          f"(generator lag ≤ {result['generator_max_lag_ms']} ms)")
+    for name, stage in (("Frames", frames), ("Reports", reports)):
+        if not stage['requests']:
+            continue
+        print(f"   {name:8} {stage['ok']}/{stage['requests']} ok | {stage['throughput_per_s']}/s | "
+              f"p50 {stage['p50_ms']} ms | p95 {stage['p95_ms']} ms | p99 {stage['p99_ms']} ms | "
+              f"errors {stage['error_rate']:.1%}")
+        for kind, count in sorted(stage['errors'].items()):
+            print(f"            ❌ {kind}: {count}")
+
+def find_knee(results: list):
+    """First step where throughput falls behind the offered rate or tail latency doubles"""
+    if not results:
+        return None
+    baseline_p95 = results[0]['frames']['p95_ms'] or 1.0
+    for result in results:
+        frames = result['frames']
+        if frames['throughput_per_s'] < 0.9 * result['offered_rate'] or frames['p95_ms'] > 2 * baseline_p95:
+            return result['offered_rate']
+    return None
+
+async def run(args):
+    frames = recorded_frames(args.frames) if args.frames else synthetic_frames()
+    if not frames:
+        print(f"❌ No frames found in {args.frames}")
+        return
+    rates = [float(rate) for rate in args.rates.split(',')] if args.rates else [args.rate]
+
+    results = []
+    for step, rate in enumerate(rates):
+        result = await run_step(args, rate, frames, step)
+        print_step(result)
+        results.append(result)
+
+    knee = find_knee(results) if len(results) > 1 else None
+    if len(results) > 1:
+        print(f"\n🦵 Knee: {f'{knee:g} frames/s' if knee else 'not reached'}")
+
+    snapshots = await agent_snapshots(args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"steps": results, "knee_rate": knee, "agents": snapshots}, f, indent=2)
+        print(f"📄 Results saved to: {args.json}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline load test")
+    parser.add_argument("--rate", type=float, default=2.0, help="Frames per second to offer")
+    parser.add_argument("--rates", help="Comma-separated rates to step through, e.g. 1,2,4,8 (finds the knee)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per rate step")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent meal sessions frames are spread over")
+    parser.add_argument("--frames", help="Folder of recorded frames to replay (default: synthetic plates)")
+    parser.add_argument("--patient-id", default="load_test_patient", help="Patient the frames are uploaded for")
+    parser.add_argument("--report-every", type=float, default=10, help="Seconds between report requests (0 = none)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--ingest-url", default="http://127.0.0.1:8011", help="Storage agent ingest endpoint")
+    parser.add_argument("--report-url", default="http://127.0.0.1:8013", help="Nutrition agent report endpoint")
+    parser.add_argument("--nutrition-url", default="http://127.0.0.1:8003", help="Nutrition agent REST endpoint")
+    parser.add_argument("--json", help="Write results (and the agents' own stats) to this file")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start the three agents with local storage and the Gemini stand-in")
+    parser.add_argument("--gemini-latency-ms", type=float, default=1500, help="Stand-in median latency")
+    parser.add_argument("--gemini-sigma", type=float, default=0.5, help="Stand-in lognormal latency spread")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Stand-in failure probability")
+    parser.add_argument("--gemini-responses", help="Recorded responses (JSONL from GEMINI_RECORD_PATH)")
+    args = parser.parse_args()
+
+    processes = []
+    if args.spawn:
+        workdir = tempfile.mkdtemp(prefix="load_test_")
+        print(f"📁 Agent state and logs: {workdir}")
+        processes = spawn_agents(args, workdir)
+    try:
+        if processes:
+            # Any HTTP answer (even 400/404) means the server is listening
+            asyncio.run(wait_until_ready([
+                f"{args.ingest_url}/ingest_stats",
+                f"http://127.0.0.1:{ANALYSIS_AGENT_PORT}/submit",
+                f"{args.report_url}/report"
+            ]))
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# meal_image_store.py
+import hashlib
+import time
+from typing import Optional
+
+from meal_images_query import DEFAULT_PATIENT_ID
+from metrics import metrics
+
+MEALS_BUCKET = 'meals'
+
+def image_digest(image_bytes: bytes) -> str:
+    """SHA-256 of the raw bytes (the same key result_cache uses for analyses)"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def image_type(image_bytes: bytes) -> tuple:
+    """(extension, content type); unknown formats are stored as PNG like before"""
+    if image_bytes.startswith(b'\xff\xd8\xff'):
+        return 'jpg', 'image/jpeg'
+    return 'png', 'image/png'
+
+def object_path(digest: str, extension: str) -> str:
+    """Content-addressed storage path, fanned out by the first hash byte"""
+    return f"objects/{digest[:2]}/{digest}.{extension}"
+
+def find_stored_image(supabase, digest: str) -> Optional[dict]:
+    """An existing meal_images row for these bytes: one lookup on the content_hash index"""
+    response = supabase.table('meal_images').select('file_path,url').eq('content_hash', digest).limit(1).execute()
+    return response.data[0] if response.data else None
+
+def store_meal_image(supabase, image_bytes: bytes, session_id: str, frame_id: str, timestamp: int,
+                     patient_id: str = DEFAULT_PATIENT_ID) -> str:
+    """Store the bytes once per SHA-256, add a meal_images row pointing at the object, return its URL
+
+    Bytes already in storage skip the upload; the new row links to the existing object
+    (same URL), so cached analyses are reused. Retrying the same frame adds no row.
+    """
+    digest = image_digest(image_bytes)
+    # The lookup counts towards the upload stage; bytes already stored are recorded as "cached"
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        stored = find_stored_image(supabase, digest)
+        if stored:
+            file_path, url = stored['file_path'], stored['url']
+            outcome = "cached"
+        else:
+            extension, content_type = image_type(image_bytes)
+            file_path = object_path(digest, extension)
+            # Two first uploads of the same bytes may race; both write the identical object
+            supabase.storage.from_(MEALS_BUCKET).upload(
+                file_path, image_bytes, file_options={"content-type": content_type, "upsert": "true"}
+            )
+            url = supabase.storage.from_(MEALS_BUCKET).get_public_url(file_path)
+            metrics.add_bytes("storage_upload", len(image_bytes))
+            outcome = "ok"
+    finally:
+        metrics.observe("storage_upload", time.perf_counter() - started, outcome)
+
+    # Unique on (content_hash, session_id, frame_id): a retried frame is a no-op
+    with metrics.track("metadata_insert"):
+        supabase.table('meal_images').upsert({
+            'session_id': session_id,
+            'frame_id': frame_id,
+            'patient_id': patient_id,
+            'file_path': file_path,
+            'url': url,
+            'content_hash': digest,
+            'uploaded_at': timestamp
+        }, on_conflict='content_hash,session_id,frame_id', ignore_duplicates=True).execute()
+
+    return url
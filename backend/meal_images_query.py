@@ -0,0 +1,83 @@
+# meal_images_query.py
+import asyncio
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows fetched per round trip when walking meal_images
+MEAL_IMAGES_PAGE_SIZE = int(os.getenv("MEAL_IMAGES_PAGE_SIZE", "500"))
+# Patient assigned to uploads that don't name one (the demo dashboard's patient)
+DEFAULT_PATIENT_ID = os.getenv("DEFAULT_PATIENT_ID", "patient_001")
+
+# Only the columns the report pipeline reads
+REPORT_COLUMNS = "id,session_id,url,content_hash,uploaded_at"
+
+def keyset_filter(uploaded_at: int, row_id: int) -> str:
+    """PostgREST filter for rows strictly after (uploaded_at, id)"""
+    return f"uploaded_at.gt.{uploaded_at},and(uploaded_at.eq.{uploaded_at},id.gt.{row_id})"
+
+async def iter_meal_image_pages(supabase, patient_id: str, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                                after: Optional[Tuple[int, Optional[int]]] = None, columns: str = REPORT_COLUMNS,
+                                page_size: int = MEAL_IMAGES_PAGE_SIZE) -> AsyncIterator[List[dict]]:
+    """Yield one patient's meal_images rows page by page in (uploaded_at, id) order
+
+    Filtering happens in Postgres and each page resumes from the last row of the
+    previous one, so every round trip is an index range scan on
+    (patient_id, uploaded_at, id) no matter how large the table is.
+    """
+    cursor = after
+    while True:
+        query = supabase.table('meal_images').select(columns).eq('patient_id', patient_id)
+        if start_ts is not None:
+            query = query.gte('uploaded_at', start_ts)
+        if end_ts is not None:
+            query = query.lte('uploaded_at', end_ts)
+        if cursor is not None:
+            uploaded_at, row_id = cursor
+            # Without an id to break ties, re-read the boundary timestamp and let the caller skip seen rows
+            query = query.gte('uploaded_at', uploaded_at) if row_id is None else query.or_(keyset_filter(uploaded_at, row_id))
+        query = query.order('uploaded_at').order('id').limit(page_size)
+
+        # supabase-py is synchronous; keep the round trip off the event loop
+        response = await asyncio.to_thread(query.execute)
+        rows = response.data
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]['uploaded_at'], rows[-1]['id'])
+
+async def meal_images_watermark(supabase, patient_id: str, start_ts: Optional[int] = None,
+                                end_ts: Optional[int] = None) -> dict:
+    """Row count and newest (uploaded_at, id) in scope: one index-backed round trip, no row bodies"""
+    query = supabase.table('meal_images').select('id,uploaded_at', count='exact').eq('patient_id', patient_id)
+    if start_ts is not None:
+        query = query.gte('uploaded_at', start_ts)
+    if end_ts is not None:
+        query = query.lte('uploaded_at', end_ts)
+    query = query.order('uploaded_at', desc=True).order('id', desc=True).limit(1)
+
+    response = await asyncio.to_thread(query.execute)
+    newest = response.data[0] if response.data else {}
+    return {'count': response.count or 0, 'uploaded_at': newest.get('uploaded_at'), 'id': newest.get('id')}
+
+async def meal_images_count_through(supabase, patient_id: str, through: Tuple[int, Optional[int]],
+                                    start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> int:
+    """Rows in scope at or before (uploaded_at, id): a count-only round trip, no row bodies"""
+    query = supabase.table('meal_images').select('id', count='exact').eq('patient_id', patient_id)
+    if start_ts is not None:
+        query = query.gte('uploaded_at', start_ts)
+    if end_ts is not None:
+        query = query.lte('uploaded_at', end_ts)
+    uploaded_at, row_id = through
+    if row_id is None:
+        query = query.lte('uploaded_at', uploaded_at)
+    else:
+        query = query.or_(f"uploaded_at.lt.{uploaded_at},and(uploaded_at.eq.{uploaded_at},id.lte.{row_id})")
+    query = query.limit(1)
+
+    response = await asyncio.to_thread(query.execute)
+    return response.count or 0
@@ -0,0 +1,132 @@
+# metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages timed across the pipeline; labels outside these sets are rejected to keep cardinality bounded
+STAGES = (
+    "base64_decode",      # storage agent: chat-protocol frames
+    "storage_upload",     # image/depth object writes
+    "metadata_insert",    # meal_images / depth_data rows
+    "image_download",     # fetching stored frames for analysis
+    "image_decode",       # PIL decode, downscale and re-encode
+    "gemini_queue",       # waiting for a Gemini concurrency slot
+    "gemini_call",        # the model call itself
+    "json_parse",         # validating the model's JSON reply
+    "field_retry",        # re-asking Gemini for fields that failed validation
+    "report_generation",  # building a patient report end to end
+    "worker_dispatch",    # dispatcher round trip to a live analysis worker
+    "agent_request"       # frontend calls to the analysis agent
+)
+OUTCOMES = ("ok", "error", "cached")
+# Why a Gemini reply failed validation: not JSON of the requested shape, or the analysis field that was invalid
+PARSE_FAILURE_REASONS = ("response", "food_items", "remaining_percent", "consumed_since_last", "estimated_calories",
+                         "confidence")
+
+# Histogram upper bounds in seconds, from sub-millisecond decodes to slow Gemini calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class StageMetrics:
+    """Per-stage latency histograms and byte counters, labelled (agent, stage, outcome)
+
+    One instance per process; the agent label is the process's agent name, so
+    series from every agent can be scraped into one Prometheus without clashing.
+    """
+
+    def __init__(self, agent: str = "unknown", buckets: tuple = LATENCY_BUCKETS):
+        self.agent = agent
+        self.buckets = buckets
+        # (stage, outcome) -> [per-bucket counts..., +Inf count, sum]
+        self._durations = {}
+        # stage -> bytes processed
+        self._bytes = {}
+        # reason -> Gemini replies that failed validation for it
+        self._parse_failures = {}
+        self._lock = threading.Lock()
+
+    def set_agent(self, agent: str):
+        self.agent = agent
+
+    def observe(self, stage: str, seconds: float, outcome: str = "ok"):
+        """Record one run of stage that took seconds"""
+        if stage not in STAGES or outcome not in OUTCOMES:
+            raise ValueError(f"Unknown stage/outcome: {stage}/{outcome}")
+        with self._lock:
+            series = self._durations.get((stage, outcome))
+            if series is None:
+                series = self._durations[(stage, outcome)] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def add_bytes(self, stage: str, size: int):
+        """Count bytes a stage moved or decoded"""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        with self._lock:
+            self._bytes[stage] = self._bytes.get(stage, 0) + size
+
+    def add_parse_failure(self, reason: str):
+        """Count a Gemini reply that was unusable (as a whole, or for one field)"""
+        if reason not in PARSE_FAILURE_REASONS:
+            raise ValueError(f"Unknown parse failure: {reason}")
+        with self._lock:
+            self._parse_failures[reason] = self._parse_failures.get(reason, 0) + 1
+
+    @contextmanager
+    def track(self, stage: str):
+        """Time the block as stage; an exception escaping it is recorded as an error"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, "error")
+            raise
+        self.observe(stage, time.perf_counter() - started)
+
+    def render(self) -> str:
+        """All series in Prometheus text format"""
+        with self._lock:
+            durations = {key: list(series) for key, series in self._durations.items()}
+            byte_counts = dict(self._bytes)
+            parse_failures = dict(self._parse_failures)
+
+        lines = [
+            "# HELP pipeline_stage_duration_seconds Time spent in each pipeline stage",
+            "# TYPE pipeline_stage_duration_seconds histogram"
+        ]
+        for (stage, outcome), series in sorted(durations.items()):
+            labels = f'agent="{self.agent}",stage="{stage}",outcome="{outcome}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'pipeline_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'pipeline_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'pipeline_stage_duration_seconds_sum{{{labels}}} {series[-1]:.6f}')
+            lines.append(f'pipeline_stage_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += [
+            "# HELP pipeline_stage_bytes_total Bytes processed by each pipeline stage",
+            "# TYPE pipeline_stage_bytes_total counter"
+        ]
+        for stage, size in sorted(byte_counts.items()):
+            lines.append(f'pipeline_stage_bytes_total{{agent="{self.agent}",stage="{stage}"}} {size}')
+
+        lines += [
+            "# HELP pipeline_parse_failures_total Gemini replies that failed validation, by reason",
+            "# TYPE pipeline_parse_failures_total counter"
+        ]
+        for reason, count in sorted(parse_failures.items()):
+            lines.append(f'pipeline_parse_failures_total{{agent="{self.agent}",reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+# Shared metrics instance
+metrics = StageMetrics()
@@ -0,0 +1,13 @@
+-- 001_meal_images_patient_keyset.sql
+-- Scope meal_images by patient and support keyset pagination on (uploaded_at, id).
+-- Run in the Supabase SQL Editor.
+
+ALTER TABLE meal_images ADD COLUMN IF NOT EXISTS patient_id TEXT;
+
+-- Rows uploaded before this column existed belong to the demo patient
+UPDATE meal_images SET patient_id = 'patient_001' WHERE patient_id IS NULL;
+
+-- Serves: WHERE patient_id = ? AND uploaded_at BETWEEN ? AND ?
+--         AND (uploaded_at, id) > (?, ?) ORDER BY uploaded_at, id LIMIT ?
+CREATE INDEX IF NOT EXISTS meal_images_patient_uploaded_id_idx
+    ON meal_images (patient_id, uploaded_at, id);
@@ -0,0 +1,12 @@
+-- 002_meal_images_content_hash.sql
+-- Content-addressed meal image uploads: rows carry the SHA-256 of their bytes.
+-- Run in the Supabase SQL Editor.
+
+ALTER TABLE meal_images ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Serves: WHERE content_hash = ? LIMIT 1 (is this object already stored?)
+-- and makes retried uploads of the same frame a no-op:
+--         INSERT ... ON CONFLICT (content_hash, session_id, frame_id) DO NOTHING
+-- Rows uploaded before this migration keep a NULL hash and are not matched.
+CREATE UNIQUE INDEX IF NOT EXISTS meal_images_content_session_frame_idx
+    ON meal_images (content_hash, session_id, frame_id);
@@ -1,12 +1,21 @@
 # nutrition_analysis_agent.py
 from uagents import Agent, Context, Protocol, Model
 from uagents.setup import fund_agent_if_low
-from supabase import create_client
-from test import analyze_food_with_gemini, HARDCODED_DEPTH_DATA
-import requests
-from PIL import Image
-import io
+from storage_backend import create_storage_client
+from test import analyze_frames_with_gemini, HARDCODED_DEPTH_DATA, GEMINI_MODEL_NAME, PROMPT_VERSION
+from test import AnalysisResult as FrameAnalysis
+from result_cache import result_cache, content_hash
+from report_engine import ReportAggregator, report_state_store
+from meal_images_query import iter_meal_image_pages, meal_images_watermark, meal_images_count_through
+from gemini_client import gemini_stats
+from http_client import fetch_bytes, close_client
+from image_preprocess import prepare_image
+from http_sidecar import start_sidecar, metrics_route
+from metrics import metrics
+from job_queue import job_queue
+from aiohttp import web
 import asyncio
+import json
 import time
 import os
 from dotenv import load_dotenv
@@ -14,8 +23,22 @@ from typing import List, Optional
 
 load_dotenv()
 
-# Initialize Supabase
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+# Initialize Supabase (or the local backend when STORAGE_BACKEND=local)
+supabase = create_storage_client()
+
+# Concurrent analysis settings (ANALYSIS_MAX_IN_FLIGHT=1 analyzes one image at a time)
+ANALYSIS_MAX_IN_FLIGHT = int(os.getenv("ANALYSIS_MAX_IN_FLIGHT", "8"))
+ANALYSIS_IMAGE_TIMEOUT = float(os.getenv("ANALYSIS_IMAGE_TIMEOUT", "90"))
+# Frames of one meal session sent per Gemini request (1 = one request per frame)
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "4"))
+# Port of the NDJSON streaming endpoint (uagents REST handlers can't stream)
+ANALYSIS_STREAM_PORT = int(os.getenv("ANALYSIS_STREAM_PORT", "8013"))
+# Background workers running submitted analysis jobs
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# Idle workers re-check the queue this often (submits wake them immediately)
+JOB_POLL_SECONDS = 2.0
+# How often finished jobs past JOB_RETENTION_SECONDS are deleted
+JOB_PURGE_INTERVAL_SECONDS = 600.0
 
 # Message Models
 class AnalysisRequest(Model):
@@ -33,6 +56,25 @@ class AnalysisResult(Model):
     confidence_score: float
     analysis_timestamp: int
 
+class CacheStats(Model):
+    hits: int
+    misses: int
+    hit_rate: float
+    entries: int
+    evictions: int
+
+class JobStats(Model):
+    queued: int
+    running: int
+    done: int
+    failed: int
+
+class GeminiStats(Model):
+    max_concurrency: int
+    stub: bool = False
+    queue_wait_seconds: dict
+    call_latency_seconds: dict
+
 # Create Analysis Agent
 analysis_agent = Agent(
     name="nutrition_analysis_agent",
@@ -44,6 +86,7 @@ analysis_agent = Agent(
 )
 
 fund_agent_if_low(analysis_agent.wallet.address())
+metrics.set_agent(analysis_agent.name)
 
 # Chat Protocol
 analysis_protocol = Protocol(name="NutritionAnalysisChat")
@@ -53,48 +96,7 @@ async def handle_analysis_request(ctx: Context, sender: str, msg: AnalysisReques
     ctx.logger.info(f"📊 Analysis request from {sender} for patient {msg.patient_id}")
     
     try:
-        # Query images from Supabase
-        query = supabase.table('meal_images').select('*')
-        
-        if msg.date_range_start:
-            query = query.gte('uploaded_at', int(time.mktime(time.strptime(msg.date_range_start, "%Y-%m-%d"))))
-        if msg.date_range_end:
-            query = query.lte('uploaded_at', int(time.mktime(time.strptime(msg.date_range_end, "%Y-%m-%d"))))
-        
-        response = query.execute()
-        images = response.data
-        
-        if not images:
-            await ctx.send(sender, AnalysisResult(
-                patient_id=msg.patient_id,
-                total_images_analyzed=0,
-                eating_patterns={},
-                nutritional_summary={},
-                recommendations=["No images found for analysis"],
-                confidence_score=0.0,
-                analysis_timestamp=int(time.time())
-            ))
-            return
-        
-        ctx.logger.info(f"📸 Analyzing {len(images)} images")
-        
-        # Analyze all images
-        analyses = []
-        valid_images = 0
-        for image_record in images:
-            ctx.logger.info(f"Processing image {valid_images + 1}/{len(images)}")
-            analysis = await analyze_single_image(image_record, ctx)
-            if analysis:
-                analyses.append(analysis)
-                valid_images += 1
-            else:
-                ctx.logger.warning(f"Skipped invalid image: {image_record.get('url', 'unknown')}")
-        
-        ctx.logger.info(f"Successfully analyzed {valid_images}/{len(images)} images")
-        
-        # Generate comprehensive report
-        report = generate_comprehensive_report(analyses, msg.patient_id)
-        
+        report = await build_patient_report(msg, ctx)
         await ctx.send(sender, report)
         
     except Exception as e:
@@ -111,6 +113,10 @@ async def handle_analysis_request(ctx: Context, sender: str, msg: AnalysisReques
 
 analysis_agent.include(analysis_protocol)
 
+@analysis_agent.on_event("shutdown")
+async def close_http_client(ctx: Context):
+    await close_client()
+
 # REST Endpoint for Frontend
 @analysis_agent.on_rest_post("/analyze", AnalysisRequest, AnalysisResult)
 async def analyze_patient_data(ctx: Context, req: AnalysisRequest) -> AnalysisResult:
@@ -118,38 +124,7 @@ async def analyze_patient_data(ctx: Context, req: AnalysisRequest) -> AnalysisRe
     ctx.logger.info(f"📊 REST analysis request for patient {req.patient_id}")
     
     try:
-        # Query images from Supabase
-        query = supabase.table('meal_images').select('*')
-        
-        if req.date_range_start:
-            query = query.gte('uploaded_at', int(time.mktime(time.strptime(req.date_range_start, "%Y-%m-%d"))))
-        if req.date_range_end:
-            query = query.lte('uploaded_at', int(time.mktime(time.strptime(req.date_range_end, "%Y-%m-%d"))))
-        
-        response = query.execute()
-        images = response.data
-        
-        if not images:
-            return AnalysisResult(
-                patient_id=req.patient_id,
-                total_images_analyzed=0,
-                eating_patterns={},
-                nutritional_summary={},
-                recommendations=["No images found for analysis"],
-                confidence_score=0.0,
-                analysis_timestamp=int(time.time())
-            )
-        
-        # Analyze all images
-        analyses = []
-        for image_record in images:
-            analysis = await analyze_single_image(image_record, ctx)
-            if analysis:
-                analyses.append(analysis)
-        
-        # Generate comprehensive report
-        report = generate_comprehensive_report(analyses, req.patient_id)
-        return report
+        return await build_patient_report(req, ctx)
         
     except Exception as e:
         ctx.logger.error(f"❌ Analysis failed: {e}")
@@ -163,163 +138,472 @@ async def analyze_patient_data(ctx: Context, req: AnalysisRequest) -> AnalysisRe
             analysis_timestamp=int(time.time())
         )
 
-async def analyze_single_image(image_record, ctx):
-    """Analyze a single image"""
-    try:
-        # Download image
-        ctx.logger.info(f"Downloading image: {image_record['url']}")
-        response = requests.get(image_record['url'], timeout=30)
-        response.raise_for_status()
-        
-        # Check if response is valid
-        if response.status_code != 200:
-            ctx.logger.error(f"Failed to download image: HTTP {response.status_code}")
-            return None
+def make_stream_routes(ctx: Context) -> list:
+    """aiohttp routes bound to the agent context captured at startup"""
+    
+    async def analyze_stream(request: web.Request) -> web.StreamResponse:
+        try:
+            req = AnalysisRequest(**await request.json())
+        except Exception as e:
+            return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+        ctx.logger.info(f"📡 Streaming analysis request for patient {req.patient_id}")
         
-        # Check content type
-        content_type = response.headers.get('content-type', '')
-        ctx.logger.info(f"Content type: {content_type}")
+        try:
+            etag = await report_etag(req)
+        except Exception as e:
+            ctx.logger.error(f"❌ Analysis failed: {e}")
+            return web.json_response({"error": f"Analysis failed: {str(e)}"}, status=502)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return web.Response(status=304, headers={'ETag': etag})
         
-        # Try to open image with error handling
+        # One JSON object per line: frame, progress (partial report), report or error
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
         try:
-            image = Image.open(io.BytesIO(response.content))
-            # Convert PNG to RGB if needed (PNG might be RGBA)
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            ctx.logger.info(f"Successfully loaded image: {image.size}, format: {image.format}, mode: {image.mode}")
-        except Exception as img_error:
-            ctx.logger.error(f"Failed to open image: {img_error}")
-            return None
+            async for event in stream_patient_report(req, ctx, etag):
+                await response.write(json.dumps(event).encode() + b'\n')
+        except ConnectionResetError:
+            ctx.logger.info(f"📡 Client left the stream for patient {req.patient_id}")
+            return response
+        except Exception as e:
+            ctx.logger.error(f"❌ Analysis failed: {e}")
+            await response.write(json.dumps({'type': 'error', 'error': f"Analysis failed: {str(e)}"}).encode() + b'\n')
+        await response.write_eof()
+        return response
+    
+    async def get_report(request: web.Request) -> web.Response:
+        try:
+            req = AnalysisRequest(**request.query)
+        except Exception as e:
+            return web.json_response({"error": f"Invalid request: {e}"}, status=400)
         
-        # Create mock request
-        class MockCaptureRequest:
-            def __init__(self, session_id, image_url, timestamp):
-                self.session_id = session_id
-                self.user_id = "nutrition_analysis"
-                self.image_url = image_url
-                self.timestamp = timestamp
+        try:
+            etag = await report_etag(req)
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                return web.Response(status=304, headers={'ETag': etag})
+            report = await build_patient_report(req, ctx, etag)
+        except Exception as e:
+            ctx.logger.error(f"❌ Analysis failed: {e}")
+            return web.json_response({"error": f"Analysis failed: {str(e)}"}, status=500)
         
-        mock_request = MockCaptureRequest(
-            image_record['session_id'],
-            image_record['url'],
-            image_record['uploaded_at']
-        )
+        # no-cache: clients may store the report but must revalidate with If-None-Match
+        return web.Response(text=report.model_dump_json(), content_type='application/json',
+                            headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    
+    async def submit_job(request: web.Request) -> web.Response:
+        try:
+            req = AnalysisRequest(**await request.json())
+        except Exception as e:
+            return web.json_response({"error": f"Invalid request: {e}"}, status=400)
         
-        # Analyze with Gemini
-        analysis = await analyze_food_with_gemini(mock_request, image, HARDCODED_DEPTH_DATA, ctx)
+        job_id = await asyncio.to_thread(job_queue.submit, req.dict())
+        job_wakeup.set()
+        ctx.logger.info(f"🗂️ Queued analysis job {job_id} for patient {req.patient_id}")
+        return web.json_response({"job_id": job_id, "status": "queued"}, status=202)
+    
+    async def get_job(request: web.Request) -> web.Response:
+        job = await asyncio.to_thread(job_queue.get, request.match_info['job_id'])
+        if job is None:
+            return web.json_response({"error": "Unknown job"}, status=404)
+        job.pop('result')
+        return web.json_response(job)
+    
+    async def get_job_result(request: web.Request) -> web.Response:
+        job = await asyncio.to_thread(job_queue.get, request.match_info['job_id'])
+        if job is None:
+            return web.json_response({"error": "Unknown job"}, status=404)
+        if job['status'] == 'failed':
+            return web.json_response({"status": "failed", "error": job['error']}, status=500)
+        if job['status'] != 'done':
+            return web.json_response({"status": job['status'], "progress": job['progress']}, status=202)
+        return web.json_response(job['result'])
+    
+    return [
+        web.post('/analyze/stream', analyze_stream),
+        web.get('/report', get_report),
+        web.post('/jobs', submit_job),
+        web.get('/jobs/{job_id}', get_job),
+        web.get('/jobs/{job_id}/result', get_job_result),
+        metrics_route()
+    ]
+
+@analysis_agent.on_event("startup")
+async def start_stream_server(ctx: Context):
+    await start_sidecar(make_stream_routes(ctx), ANALYSIS_STREAM_PORT)
+    ctx.logger.info(f"📡 Streaming analysis endpoint: http://localhost:{ANALYSIS_STREAM_PORT}/analyze/stream")
+
+# Set on submit so an idle worker picks the job up without waiting for its next poll
+job_wakeup = asyncio.Event()
+job_workers = []
+
+@analysis_agent.on_event("startup")
+async def start_job_workers(ctx: Context):
+    requeued = await asyncio.to_thread(job_queue.requeue_running)
+    if requeued:
+        ctx.logger.info(f"🗂️ Requeued {requeued} jobs interrupted by the last shutdown")
+    for worker_id in range(max(1, ANALYSIS_JOB_WORKERS)):
+        job_workers.append(asyncio.ensure_future(job_worker(ctx, worker_id)))
+    ctx.logger.info(f"🗂️ Started {len(job_workers)} analysis job workers")
+
+@analysis_agent.on_event("shutdown")
+async def stop_job_workers(ctx: Context):
+    for task in job_workers:
+        task.cancel()
+
+@analysis_agent.on_interval(period=JOB_PURGE_INTERVAL_SECONDS)
+async def purge_finished_jobs(ctx: Context):
+    purged = await asyncio.to_thread(job_queue.purge)
+    if purged:
+        ctx.logger.info(f"🧹 Purged {purged} finished analysis jobs")
+
+async def job_worker(ctx, worker_id):
+    """Claim queued jobs one at a time until cancelled"""
+    while True:
+        job = await asyncio.to_thread(job_queue.claim)
+        if job is None:
+            job_wakeup.clear()
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
         
-        return {
-            'timestamp': image_record['uploaded_at'],
-            'session_id': image_record['session_id'],
-            'analysis': analysis
-        }
+        ctx.logger.info(f"🗂️ Worker {worker_id} running job {job['job_id']}")
+        await run_analysis_job(job, ctx)
+
+async def run_analysis_job(job, ctx):
+    """Run one job's report, recording progress and partial results as it goes"""
+    job_id = job['job_id']
+    progress = {'frames_analyzed': 0, 'partial_report': None}
+    try:
+        req = AnalysisRequest(**job['payload'])
+        report = None
+        async for event in stream_patient_report(req, ctx):
+            if event['type'] == 'frame':
+                progress['frames_analyzed'] += 1
+            elif event['type'] == 'progress':
+                progress['partial_report'] = event['report']
+            elif event['type'] == 'report':
+                report = event['report']
+                continue
+            await asyncio.to_thread(job_queue.update_progress, job_id, progress)
         
+        await asyncio.to_thread(job_queue.complete, job_id, report)
+        ctx.logger.info(f"✅ Job {job_id} done ({progress['frames_analyzed']} new frames)")
+    except asyncio.CancelledError:
+        # Left as running; requeued on the next startup
+        raise
     except Exception as e:
-        ctx.logger.error(f"❌ Failed to analyze image: {e}")
-        return None
+        ctx.logger.error(f"❌ Job {job_id} failed: {e}")
+        await asyncio.to_thread(job_queue.fail, job_id, f"Analysis failed: {str(e)}")
 
-def generate_comprehensive_report(analyses, patient_id):
-    """Generate comprehensive nutrition and eating pattern report"""
-    
-    if not analyses:
-        return AnalysisResult(
-            patient_id=patient_id,
-            total_images_analyzed=0,
-            eating_patterns={},
-            nutritional_summary={},
-            recommendations=["No successful analyses"],
-            confidence_score=0.0,
-            analysis_timestamp=int(time.time())
-        )
-    
-    # Group analyses by meal sessions (within 1 hour = same meal)
-    meal_sessions = group_analyses_by_meal_session(analyses)
+def date_to_timestamp(date_str: str) -> int:
+    """Convert a YYYY-MM-DD date to a unix timestamp"""
+    return int(time.mktime(time.strptime(date_str, "%Y-%m-%d")))
+
+async def build_patient_report(req: AnalysisRequest, ctx, etag: Optional[str] = None) -> AnalysisResult:
+    """Fold images newer than the stored watermark into the patient's report state"""
+    report = None
+    async for event in stream_patient_report(req, ctx, etag):
+        if event['type'] == 'report':
+            report = AnalysisResult(**event['report'])
+    return report
+
+async def report_etag(req: AnalysisRequest) -> str:
+    """ETag of the report req would produce, from a metadata-only meal_images query"""
+    scope = report_state_store.scope_key(req.patient_id, req.date_range_start, req.date_range_end)
+    watermark = await meal_images_watermark(
+        supabase,
+        req.patient_id,
+        start_ts=date_to_timestamp(req.date_range_start) if req.date_range_start else None,
+        end_ts=date_to_timestamp(req.date_range_end) if req.date_range_end else None
+    )
+    return report_state_store.etag(report_state_store.report_key(scope, req.analysis_type), watermark)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (comma-separated list or *)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def stream_patient_report(req: AnalysisRequest, ctx, etag: Optional[str] = None):
+    """Yield per-frame results and running partial reports, then the final report"""
+    started = time.perf_counter()
+    try:
+        scope = report_state_store.scope_key(req.patient_id, req.date_range_start, req.date_range_end)
+        report_key = report_state_store.report_key(scope, req.analysis_type)
     
-    # Analyze eating patterns based on meal sessions
-    session_timestamps = [session['timestamp'] for session in meal_sessions]
-    session_timestamps.sort()
+        # Unchanged meal_images since the last report: serve it without touching any rows
+        etag = etag or await report_etag(req)
+        cached = report_state_store.load_report(report_key, etag)
+        if cached:
+            ctx.logger.info(f"♻️ Report cache hit for patient {req.patient_id} ({etag})")
+            metrics.observe("report_generation", time.perf_counter() - started, "cached")
+            yield {'type': 'report', 'report': cached, 'etag': etag}
+            return
     
-    # Calculate time intervals between meal sessions
-    intervals = []
-    for i in range(1, len(session_timestamps)):
-        interval_hours = (session_timestamps[i] - session_timestamps[i-1]) / 3600
-        intervals.append(interval_hours)
+        start_ts = date_to_timestamp(req.date_range_start) if req.date_range_start else None
+        end_ts = date_to_timestamp(req.date_range_end) if req.date_range_end else None
+        aggregator = ReportAggregator(report_state_store.load(scope))
     
-    avg_interval = sum(intervals) / len(intervals) if intervals else 0
+        # Rows removed behind the watermark are still counted in the state: rebuild the scope from scratch
+        if aggregator.rows_seen:
+            remaining = await meal_images_count_through(supabase, req.patient_id, aggregator.keyset_cursor(),
+                                                        start_ts, end_ts)
+            if remaining < aggregator.rows_seen:
+                ctx.logger.warning(f"🧹 {aggregator.rows_seen - remaining} folded images were removed; "
+                                   f"rebuilding report for patient {req.patient_id}")
+                report_state_store.reset(scope)
+                aggregator = ReportAggregator()
     
-    # Analyze food consumption patterns per meal session
-    total_consumed_per_session = []
-    total_calories_per_session = []
-    all_foods = []
+        # Walk only this patient's images after the watermark, one page at a time
+        pages = iter_meal_image_pages(
+            supabase,
+            req.patient_id,
+            start_ts=start_ts,
+            end_ts=end_ts,
+            after=aggregator.keyset_cursor()
+        )
     
-    for session in meal_sessions:
-        # Sum up consumption from all images in this meal session
-        session_consumed = sum(analysis['analysis'].consumed_since_last for analysis in session['analyses'])
-        session_calories = sum(analysis['analysis'].estimated_calories for analysis in session['analyses'])
+        # Set once a row fails: the watermark stays in front of it and later rows wait for the next run
+        held_back = None
+        async for page in pages:
+            images = [record for record in page if not aggregator.is_folded(record)]
+            if not images:
+                continue
+        
+            ctx.logger.info(f"📸 Analyzing {len(images)} new images (watermark: {aggregator.watermark})")
+        
+            # Batches finish out of order, but the aggregator needs timestamp order:
+            # fold the longest finished prefix and report partial totals as it grows
+            finished_ids = set()
+            results = {}
+            next_row = 0
+            analyzed = 0
+            async for index, batch, analyses in iter_batch_analyses(images, ctx):
+                for analysis in analyses:
+                    yield {'type': 'frame', **frame_event(analysis)}
+                    results[analysis['id']] = analysis
+                finished_ids.update(record.get('id') for record in batch)
+                analyzed += len(analyses)
+            
+                folded = False
+                while held_back is None and next_row < len(images) and images[next_row].get('id') in finished_ids:
+                    record = images[next_row]
+                    if aggregator.fold_row(record, results.get(record.get('id'))):
+                        next_row += 1
+                        folded = True
+                    else:
+                        held_back = record
+                if folded and aggregator.total_images:
+                    yield {'type': 'progress', 'report': report_from_aggregator(aggregator, req.patient_id).dict()}
         
-        total_consumed_per_session.append(session_consumed)
-        total_calories_per_session.append(session_calories)
+            # Checkpoint per page so an interrupted report resumes where it stopped
+            report_state_store.save(scope, aggregator.to_state())
         
-        # Collect all food items from this session
-        for analysis in session['analyses']:
-            for food in analysis['analysis'].food_items:
-                all_foods.append(food.name)
+            ctx.logger.info(f"Successfully analyzed {analyzed}/{len(images)} images")
+            ctx.logger.info(f"♻️ Result cache: {result_cache.stats()}")
+            ctx.logger.info(f"🔍 Gemini: {gemini_stats()}")
+            if held_back is not None:
+                ctx.logger.warning(f"🔁 Image {held_back.get('id')} failed; it and later images are retried next run")
+                break
     
-    avg_consumed_per_session = sum(total_consumed_per_session) / len(total_consumed_per_session) if total_consumed_per_session else 0
-    total_calories = sum(total_calories_per_session)
+        if aggregator.rows_seen == 0 and held_back is None:
+            report = AnalysisResult(
+                patient_id=req.patient_id,
+                total_images_analyzed=0,
+                eating_patterns={},
+                nutritional_summary={},
+                recommendations=["No images found for analysis"],
+                confidence_score=0.0,
+                analysis_timestamp=int(time.time())
+            )
+        else:
+            report = report_from_aggregator(aggregator, req.patient_id)
     
-    # Generate recommendations based on meal sessions
-    recommendations = []
+        # Keyed by the watermark read before the run; rows added meanwhile change the ETag.
+        # A report missing held-back rows isn't cached, so the next request retries them
+        if held_back is None:
+            report_state_store.save_report(report_key, etag, report.dict())
+        metrics.observe("report_generation", time.perf_counter() - started)
+        yield {'type': 'report', 'report': report.dict(), 'etag': etag}
+    except Exception:
+        metrics.observe("report_generation", time.perf_counter() - started, "error")
+        raise
+
+def frame_event(analysis):
+    """JSON-safe per-frame result for streaming clients"""
+    return {
+        'timestamp': analysis['timestamp'],
+        'session_id': analysis['session_id'],
+        **analysis['analysis'].dict()
+    }
+
+@analysis_agent.on_rest_get("/cache_stats", CacheStats)
+async def get_cache_stats(ctx: Context) -> CacheStats:
+    """Per-frame result cache hit/miss counters"""
+    return CacheStats(**result_cache.stats())
+
+@analysis_agent.on_rest_get("/job_stats", JobStats)
+async def get_job_stats(ctx: Context) -> JobStats:
+    """Analysis job counts by status"""
+    return JobStats(**job_queue.stats())
+
+@analysis_agent.on_rest_get("/gemini_stats", GeminiStats)
+async def get_gemini_stats(ctx: Context) -> GeminiStats:
+    """Gemini queue-wait and call-latency summaries for sizing GEMINI_MAX_CONCURRENCY"""
+    return GeminiStats(**gemini_stats())
+
+async def iter_batch_analyses(image_records, ctx, max_in_flight=ANALYSIS_MAX_IN_FLIGHT, timeout=ANALYSIS_IMAGE_TIMEOUT,
+                              batch_size=ANALYSIS_BATCH_SIZE):
+    """Analyze meal-session batches concurrently (bounded), yielding (batch index, records, analyses) as each finishes"""
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+    batches = meal_session_batches(image_records, max(1, batch_size))
+    total = len(batches)
     
-    if avg_interval < 2:
-        recommendations.append("⚠️ Eating too frequently - consider spacing meals 3-4 hours apart")
-    elif avg_interval > 6:
-        recommendations.append("⚠️ Long gaps between meals - consider more regular eating schedule")
-    else:
-        recommendations.append("✅ Good meal timing - regular eating pattern detected")
+    async def run(index, batch):
+        async with semaphore:
+            ctx.logger.info(f"Processing batch {index + 1}/{total} ({len(batch)} images)")
+            try:
+                analyses = await asyncio.wait_for(analyze_image_batch(batch, ctx), timeout * len(batch))
+            except asyncio.TimeoutError:
+                ctx.logger.warning(f"⏱️ Timed out after {timeout * len(batch)}s: {[r.get('url', 'unknown') for r in batch]}")
+                return index, batch, []
+            if len(analyses) < len(batch):
+                ctx.logger.warning(f"Skipped {len(batch) - len(analyses)} invalid images in batch {index + 1}")
+            return index, batch, analyses
     
-    if avg_consumed_per_session < 20:
-        recommendations.append("⚠️ Low food consumption per meal - consider increasing portion sizes")
-    elif avg_consumed_per_session > 80:
-        recommendations.append("⚠️ High food consumption per meal - consider portion control")
-    else:
-        recommendations.append("✅ Moderate food consumption per meal - good portion control")
+    tasks = [asyncio.ensure_future(run(i, batch)) for i, batch in enumerate(batches)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # A client that stops reading a stream shouldn't leave Gemini calls running
+        for task in tasks:
+            task.cancel()
+
+def meal_session_batches(image_records, batch_size):
+    """Split records into chunks of at most batch_size frames from the same meal session"""
+    items = [{'timestamp': record['uploaded_at'], 'record': record} for record in image_records]
+    batches = []
+    for session in group_analyses_by_meal_session(items):
+        records = [item['record'] for item in session['analyses']]
+        batches.extend(records[i:i + batch_size] for i in range(0, len(records), batch_size))
+    return batches
+
+class MockCaptureRequest:
+    """Stands in for a live CaptureRequest when re-analyzing stored images"""
+    def __init__(self, session_id, image_url, timestamp):
+        self.session_id = session_id
+        self.user_id = "nutrition_analysis"
+        self.image_url = image_url
+        self.timestamp = timestamp
+
+async def load_frame(image_record, ctx):
+    """Resolve a record from the result cache, or download and decode its image"""
+    frame = {'record': image_record, 'digest': None, 'image': None, 'analysis': None}
+    try:
+        # Stored frames never change, so a previously analyzed URL skips download and Gemini
+        cached = result_cache.get_by_url(image_record['url'], GEMINI_MODEL_NAME, PROMPT_VERSION)
+        if cached:
+            ctx.logger.info(f"♻️ Cache hit (url): {image_record['url']}")
+            frame['analysis'] = FrameAnalysis(**cached)
+            return frame
+        
+        # Content-addressed uploads carry their SHA-256, so the content lookup needs no download
+        frame['digest'] = image_record.get('content_hash')
+        if frame['digest']:
+            cached = result_cache.get(frame['digest'], GEMINI_MODEL_NAME, PROMPT_VERSION)
+            if cached:
+                ctx.logger.info(f"♻️ Cache hit (content hash): {image_record['url']}")
+                result_cache.remember_url(image_record['url'], frame['digest'])
+                frame['analysis'] = FrameAnalysis(**cached)
+                return frame
+        
+        # Download image over the shared pooled client
+        ctx.logger.info(f"Downloading image: {image_record['url']}")
+        with metrics.track("image_download"):
+            image_bytes = await fetch_bytes(image_record['url'])
+        metrics.add_bytes("image_download", len(image_bytes))
+        ctx.logger.info(f"Downloaded {len(image_bytes)} bytes")
+        
+        # Same bytes under a different URL (re-uploads) can still reuse the analysis
+        if not frame['digest']:
+            frame['digest'] = content_hash(image_bytes)
+            cached = result_cache.get(frame['digest'], GEMINI_MODEL_NAME, PROMPT_VERSION)
+            if cached:
+                ctx.logger.info(f"♻️ Cache hit (content): {image_record['url']}")
+                result_cache.remember_url(image_record['url'], frame['digest'])
+                frame['analysis'] = FrameAnalysis(**cached)
+                return frame
+        
+        # Downscale and re-encode before the model call (CPU-bound, so off the event loop)
+        try:
+            with metrics.track("image_decode"):
+                frame['image'] = await asyncio.to_thread(prepare_image, image_bytes)
+            ctx.logger.info(f"Prepared image: {len(image_bytes)} → {len(frame['image']['data'])} bytes")
+        except Exception as img_error:
+            ctx.logger.error(f"Failed to open image: {img_error}")
+            return None
+        
+        return frame
+        
+    except Exception as e:
+        ctx.logger.error(f"❌ Failed to load image: {e}")
+        return None
+
+async def analyze_image_batch(image_records, ctx):
+    """Analyze frames of one meal session, sending all uncached frames in one Gemini request"""
+    frames = await asyncio.gather(*(load_frame(record, ctx) for record in image_records))
+    frames = [frame for frame in frames if frame]
     
-    # Nutritional recommendations
-    food_categories = {}
-    for food in all_foods:
-        # Simple categorization
-        if any(word in food.lower() for word in ['vegetable', 'salad', 'broccoli', 'carrot']):
-            food_categories['vegetables'] = food_categories.get('vegetables', 0) + 1
-        elif any(word in food.lower() for word in ['meat', 'chicken', 'beef', 'fish']):
-            food_categories['protein'] = food_categories.get('protein', 0) + 1
-        elif any(word in food.lower() for word in ['bread', 'pasta', 'rice', 'potato']):
-            food_categories['carbs'] = food_categories.get('carbs', 0) + 1
+    pending = [frame for frame in frames if frame['analysis'] is None]
+    if pending:
+        try:
+            capture_requests = [
+                MockCaptureRequest(f['record']['session_id'], f['record']['url'], f['record']['uploaded_at'])
+                for f in pending
+            ]
+            # Stored frames are re-analyzed on their own, never against the live agent's session state
+            results = await analyze_frames_with_gemini(capture_requests, [f['image'] for f in pending], HARDCODED_DEPTH_DATA, ctx,
+                                                       session_state={})
+        except Exception as e:
+            ctx.logger.error(f"❌ Failed to analyze batch: {e}")
+            return [frame_analysis(f) for f in frames if f['analysis'] is not None]
+        
+        for frame, analysis in zip(pending, results):
+            frame['analysis'] = analysis
+            # Zero-confidence results are the failure fallback and must be retried next time
+            if analysis.confidence > 0:
+                result_cache.put(frame['digest'], GEMINI_MODEL_NAME, PROMPT_VERSION, analysis.dict(),
+                                 url=frame['record']['url'])
     
-    if food_categories.get('vegetables', 0) < len(meal_sessions) * 0.3:
-        recommendations.append("🥬 Consider increasing vegetable intake")
+    return [frame_analysis(frame) for frame in frames]
+
+def frame_analysis(frame):
+    """Report entry for an analyzed frame"""
+    return {
+        'id': frame['record'].get('id'),
+        'timestamp': frame['record']['uploaded_at'],
+        'session_id': frame['record']['session_id'],
+        'analysis': frame['analysis']
+    }
+
+def report_from_aggregator(aggregator, patient_id):
+    """Build the AnalysisResult for an aggregator's running totals"""
+    if aggregator.total_images == 0:
+        return AnalysisResult(
+            patient_id=patient_id,
+            total_images_analyzed=0,
+            eating_patterns={},
+            nutritional_summary={},
+            recommendations=["No successful analyses"],
+            confidence_score=0.0,
+            analysis_timestamp=int(time.time())
+        )
     
-    return AnalysisResult(
-        patient_id=patient_id,
-        total_images_analyzed=len(analyses),
-        eating_patterns={
-            "total_meal_sessions": len(meal_sessions),
-            "total_images": len(analyses),
-            "avg_interval_hours": round(avg_interval, 2),
-            "regular_eating": avg_interval >= 2 and avg_interval <= 6,
-            "avg_consumption_per_session": round(avg_consumed_per_session, 2),
-            "meal_grouping_note": "Images within 1 hour grouped as same meal"
-        },
-        nutritional_summary={
-            "total_calories": total_calories,
-            "avg_calories_per_session": round(total_calories / len(meal_sessions), 2) if meal_sessions else 0,
-            "food_categories": food_categories,
-            "most_common_foods": list(set(all_foods))[:5]
-        },
-        recommendations=recommendations,
-        confidence_score=0.85,
-        analysis_timestamp=int(time.time())
-    )
+    return AnalysisResult(patient_id=patient_id, **aggregator.report_fields())
 
 def group_analyses_by_meal_session(analyses):
     """Group analyses by meal sessions (within 1 hour = same meal)"""
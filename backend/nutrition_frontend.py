@@ -1,12 +1,32 @@
 # nutrition_frontend.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import requests
 import json
+import time
+from metrics import metrics, CONTENT_TYPE
 
 app = Flask(__name__)
+metrics.set_agent("nutrition_frontend")
 
 # Agent endpoints
 ANALYSIS_AGENT_URL = "http://127.0.0.1:8003"
+ANALYSIS_STREAM_URL = "http://127.0.0.1:8013"
+
+# (connect, read) timeouts for agent calls
+AGENT_TIMEOUT = (5, 30)
+ANALYZE_TIMEOUT = (5, 600)
+
+def agent_request(method: str, url: str, **kwargs) -> requests.Response:
+    """Call an analysis agent endpoint, timed as the agent_request stage (5xx counts as an error)"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = requests.request(method, url, **kwargs)
+        if response.status_code < 500:
+            outcome = "ok"
+        return response
+    finally:
+        metrics.observe("agent_request", time.perf_counter() - started, outcome)
 
 @app.route('/')
 def index():
@@ -29,7 +49,7 @@ def analyze_patient():
         }
         
         # Call analysis agent
-        response = requests.post(f"{ANALYSIS_AGENT_URL}/analyze", json=payload)
+        response = agent_request("POST", f"{ANALYSIS_AGENT_URL}/analyze", json=payload, timeout=ANALYZE_TIMEOUT)
         response.raise_for_status()
         
         result = response.json()
@@ -44,11 +64,100 @@ def analyze_patient():
     except Exception as e:
         return jsonify({"error": f"Analysis failed: {str(e)}"})
 
+@app.route('/analyze_patient/stream', methods=['POST'])
+def analyze_patient_stream():
+    """Relay the analysis agent's NDJSON progress stream to the browser"""
+    payload = {
+        "patient_id": "patient_001",
+        "date_range_start": None,
+        "date_range_end": None,
+        "analysis_type": "comprehensive"
+    }
+    
+    # Pass the browser's cached report ETag through; unchanged patients get a 304
+    headers = {}
+    if request.headers.get('If-None-Match'):
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    
+    try:
+        # Connect timeout only; the stream itself may run for minutes
+        upstream = agent_request("POST", f"{ANALYSIS_STREAM_URL}/analyze/stream", json=payload, headers=headers,
+                                 stream=True, timeout=(5, None))
+        if upstream.status_code == 304:
+            return Response(status=304, headers={'ETag': upstream.headers.get('ETag', '')})
+        upstream.raise_for_status()
+    except requests.RequestException as e:
+        return jsonify({"error": f"Failed to connect to analysis agent: {str(e)}"}), 502
+    
+    def relay():
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            upstream.close()
+    
+    return Response(stream_with_context(relay()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/patient_report')
+def patient_report():
+    """Latest report as a cacheable resource (ETag / If-None-Match)"""
+    params = {"patient_id": "patient_001", "analysis_type": "comprehensive"}
+    headers = {}
+    if request.headers.get('If-None-Match'):
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    
+    try:
+        response = agent_request("GET", f"{ANALYSIS_STREAM_URL}/report", params=params, headers=headers, timeout=ANALYZE_TIMEOUT)
+        etag_headers = {'ETag': response.headers.get('ETag', ''), 'Cache-Control': 'no-cache'}
+        if response.status_code == 304:
+            return Response(status=304, headers=etag_headers)
+        response.raise_for_status()
+        return Response(response.content, mimetype='application/json', headers=etag_headers)
+    except requests.RequestException as e:
+        return jsonify({"error": f"Failed to connect to analysis agent: {str(e)}"}), 502
+
+@app.route('/analyze_patient/jobs', methods=['POST'])
+def submit_analysis_job():
+    """Queue a patient analysis on the agent and return its job id"""
+    payload = {
+        "patient_id": "patient_001",
+        "date_range_start": None,
+        "date_range_end": None,
+        "analysis_type": "comprehensive"
+    }
+    
+    try:
+        response = agent_request("POST", f"{ANALYSIS_STREAM_URL}/jobs", json=payload, timeout=AGENT_TIMEOUT)
+        response.raise_for_status()
+        return jsonify({"success": True, **response.json()})
+    except requests.RequestException as e:
+        return jsonify({"error": f"Failed to connect to analysis agent: {str(e)}"})
+
+@app.route('/analyze_patient/jobs/<job_id>')
+def analysis_job_status(job_id):
+    """Job status with progress, partial report and, once done, the final analysis"""
+    try:
+        response = agent_request("GET", f"{ANALYSIS_STREAM_URL}/jobs/{job_id}", timeout=AGENT_TIMEOUT)
+        if response.status_code == 404:
+            return jsonify({"error": "Unknown analysis job"}), 404
+        response.raise_for_status()
+        job = response.json()
+        
+        if job['status'] == 'done':
+            result = agent_request("GET", f"{ANALYSIS_STREAM_URL}/jobs/{job_id}/result", timeout=AGENT_TIMEOUT)
+            result.raise_for_status()
+            job['analysis'] = result.json()
+        
+        return jsonify({"success": True, **job})
+    except requests.RequestException as e:
+        return jsonify({"error": f"Failed to connect to analysis agent: {str(e)}"})
+
 @app.route('/health')
 def health_check():
     """Check health of analysis agent"""
     try:
-        response = requests.get(f"{ANALYSIS_AGENT_URL}/health", timeout=5)
+        response = agent_request("GET", f"{ANALYSIS_AGENT_URL}/health", timeout=5)
         if response.status_code == 200:
             return jsonify({"status": "healthy", "agent": "nutrition_analysis_agent"})
         else:
@@ -56,5 +165,10 @@ def health_check():
     except:
         return jsonify({"status": "offline", "agent": "nutrition_analysis_agent"})
 
+@app.route('/metrics')
+def get_metrics():
+    """Stage latency histograms for Prometheus to scrape"""
+    return Response(metrics.render(), headers={'Content-Type': CONTENT_TYPE})
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
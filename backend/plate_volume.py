@@ -0,0 +1,107 @@
+# plate_volume.py
+import os
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from depth_format import depth_in_metres
+
+load_dotenv()
+
+# Depth camera field of view, used to turn pixels into table-surface area
+DEPTH_HFOV_DEGREES = float(os.getenv("DEPTH_HFOV_DEGREES", "60"))
+DEPTH_VFOV_DEGREES = float(os.getenv("DEPTH_VFOV_DEGREES", "45"))
+
+# Heights below this are sensor noise on the table/plate, not food
+MIN_FOOD_HEIGHT_M = 0.004
+# Grids with fewer valid readings than this fraction are not measured
+MIN_VALID_FRACTION = 0.5
+# Outer ring used to seed the table fit (food is usually near the centre)
+BORDER_FRACTION = 0.15
+PLANE_FIT_ITERATIONS = 3
+
+@lru_cache(maxsize=8)
+def _design_matrix(height: int, width: int):
+    """(N, 3) matrix of normalized [x, y, 1] per pixel and the border-ring mask"""
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    x = (xs / max(width - 1, 1) * 2 - 1).ravel()
+    y = (ys / max(height - 1, 1) * 2 - 1).ravel()
+    border = (np.abs(x) > 1 - 2 * BORDER_FRACTION) | (np.abs(y) > 1 - 2 * BORDER_FRACTION)
+    return np.column_stack([x, y, np.ones_like(x)]), border
+
+def _solve_plane(design: np.ndarray, z: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Least-squares depth = a*x + b*y + c over masked points via the 3x3 normal equations"""
+    weighted = design * mask[:, None]
+    return np.linalg.solve(weighted.T @ design, weighted.T @ np.where(mask, z, 0))
+
+def fit_table_plane(depth_m: np.ndarray):
+    """Robustly fit the table/plate plane; returns (coefficients, plane depth per pixel)"""
+    height, width = depth_m.shape
+    design, border = _design_matrix(height, width)
+    z = depth_m.ravel()
+    valid = np.isfinite(z)
+
+    # Seed from the border ring, then refit on points close to the plane (MAD trimming)
+    mask = valid & border
+    if mask.sum() < 3:
+        mask = valid
+    for _ in range(PLANE_FIT_ITERATIONS):
+        coef = _solve_plane(design, z, mask)
+        plane = design @ coef
+        residual = np.abs(z - plane)
+        # Every 4th inlier is plenty for a scale estimate and keeps the median cheap
+        mad = np.median(residual[mask][::4])
+        threshold = max(3 * 1.4826 * mad, MIN_FOOD_HEIGHT_M / 2)
+        next_mask = valid & (residual < threshold)
+        if next_mask.sum() < 3:
+            break
+        mask = next_mask
+
+    return coef, plane.reshape(height, width).astype(np.float32)
+
+def plate_food_volume_ml(depth_data: dict) -> Optional[float]:
+    """Food volume above the fitted plane in millilitres, or None if the grid can't be measured"""
+    if depth_data.get('synthetic'):
+        return None
+
+    depth_m = depth_in_metres(depth_data)
+    height, width = depth_m.shape
+    if np.isfinite(depth_m).mean() < MIN_VALID_FRACTION:
+        return None
+
+    _, plane = fit_table_plane(depth_m)
+
+    # Food sits closer to the camera than the table, so its height is plane - depth
+    food_height = np.nan_to_num(plane - depth_m, nan=0.0)
+    food_height[food_height < MIN_FOOD_HEIGHT_M] = 0.0
+
+    # Each pixel covers a patch of table that grows with distance
+    pixel_w = 2 * plane * np.tan(np.radians(DEPTH_HFOV_DEGREES) / 2) / width
+    pixel_h = 2 * plane * np.tan(np.radians(DEPTH_VFOV_DEGREES) / 2) / height
+    volume_m3 = float((food_height * pixel_w * pixel_h).sum())
+    return volume_m3 * 1e6
+
+def volume_consumption(session: dict, volume_ml: float) -> dict:
+    """Remaining/consumed percentages relative to the session's first measured frame"""
+    baseline = session.get('baseline_volume_ml') or volume_ml
+    previous = session.get('last_volume_ml', baseline)
+    if baseline <= 0:
+        return {'remaining_percent': 100.0, 'consumed_since_last': 0.0, 'baseline_volume_ml': baseline}
+
+    remaining = min(100.0, max(0.0, volume_ml / baseline * 100))
+    consumed = max(0.0, (previous - volume_ml) / baseline * 100)
+    return {
+        'remaining_percent': round(remaining, 1),
+        'consumed_since_last': round(consumed, 1),
+        'baseline_volume_ml': baseline
+    }
+
+def record_volume(session: dict, volume_ml: Optional[float]):
+    """Store the first and latest measured volumes on a session dict"""
+    if volume_ml is None:
+        return
+    if not session.get('baseline_volume_ml'):
+        session['baseline_volume_ml'] = volume_ml
+    session['last_volume_ml'] = volume_ml
@@ -1,11 +1,11 @@
 # query_uploads.py
-from supabase import create_client
+from storage_backend import create_storage_client
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+supabase = create_storage_client()
 
 def query_recent_uploads(limit=10):
     """Query recent uploads from database"""
@@ -0,0 +1,328 @@
+# report_engine.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REPORT_STATE_PATH = os.getenv("REPORT_STATE_PATH", "report_state.db")
+# Distinct food names tracked for most_common_foods; counts are exact while a
+# patient has eaten fewer distinct foods than this
+REPORT_TOP_FOODS_CAPACITY = int(os.getenv("REPORT_TOP_FOODS_CAPACITY", "64"))
+
+# Images within 1 hour of a session's first image belong to the same meal
+MEAL_SESSION_GAP_HOURS = 1.0
+# Report runs a row may fail in (error, timeout or zero-confidence fallback) before it is skipped for good;
+# until then the watermark stops in front of it so the next run retries it
+REPORT_MAX_ROW_ATTEMPTS = int(os.getenv("REPORT_MAX_ROW_ATTEMPTS", "3"))
+
+FOOD_CATEGORY_KEYWORDS = {
+    'vegetables': ['vegetable', 'salad', 'broccoli', 'carrot'],
+    'protein': ['meat', 'chicken', 'beef', 'fish'],
+    'carbs': ['bread', 'pasta', 'rice', 'potato'],
+}
+
+def categorize_food(name: str) -> Optional[str]:
+    """Simple keyword categorization (first matching category wins)"""
+    lowered = name.lower()
+    for category, keywords in FOOD_CATEGORY_KEYWORDS.items():
+        if any(word in lowered for word in keywords):
+            return category
+    return None
+
+class TopKCounter:
+    """Space-Saving heavy-hitter counter: bounded memory, exact below capacity
+
+    When full, a new name replaces the current minimum and inherits its count,
+    which is remembered as the name's maximum overcount (error).
+    """
+
+    def __init__(self, capacity: int = REPORT_TOP_FOODS_CAPACITY, state: Optional[dict] = None):
+        self.capacity = max(1, capacity)
+        self.counters = {}
+        for name, value in (state or {}).items():
+            # Older report states stored plain {name: count}
+            count, error = (value, 0) if isinstance(value, int) else value
+            self.counters[name] = [count, error]
+        while len(self.counters) > self.capacity:
+            del self.counters[min(self.counters, key=lambda name: self.counters[name][0])]
+
+    def add(self, name: str):
+        counter = self.counters.get(name)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self.counters) < self.capacity:
+            self.counters[name] = [1, 0]
+        else:
+            evicted = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(evicted)[0]
+            self.counters[name] = [floor + 1, floor]
+
+    def top(self, n: int) -> list:
+        return sorted(self.counters, key=lambda name: (-self.counters[name][0], name))[:n]
+
+    def to_state(self) -> dict:
+        return self.counters
+
+class ReportAggregator:
+    """Running report totals that analyses are folded into in timestamp order"""
+
+    def __init__(self, state: Optional[dict] = None):
+        state = state or {}
+        self.rows_seen = state.get('rows_seen', 0)
+        self.total_images = state.get('total_images', 0)
+        self.closed_sessions = state.get('closed_sessions', 0)
+        self.closed_consumed = state.get('closed_consumed', 0.0)
+        self.total_calories = state.get('total_calories', 0)
+        self.interval_sum_hours = state.get('interval_sum_hours', 0.0)
+        self.interval_count = state.get('interval_count', 0)
+        self.open_session = state.get('open_session')
+        self.food_counts = TopKCounter(state=state.get('food_counts'))
+        self.food_categories = state.get('food_categories', {})
+        self.watermark = state.get('watermark')
+        self.watermark_ids = state.get('watermark_ids', [])
+        # Row id -> report runs its analysis has failed in so far
+        self.failed_attempts = state.get('failed_attempts', {})
+        self.rows_skipped = state.get('rows_skipped', 0)
+
+    def add(self, analysis: dict):
+        """Fold one analysis ({'timestamp', 'analysis', ...}) into the totals"""
+        timestamp = analysis['timestamp']
+        result = analysis['analysis']
+
+        session = self.open_session
+        if session is None or (timestamp - session['timestamp']) / 3600 > MEAL_SESSION_GAP_HOURS:
+            if session is not None:
+                # Close the previous meal session
+                self.closed_sessions += 1
+                self.closed_consumed += session['consumed']
+                self.interval_sum_hours += (timestamp - session['timestamp']) / 3600
+                self.interval_count += 1
+            session = self.open_session = {'timestamp': timestamp, 'consumed': 0.0}
+
+        session['consumed'] += result.consumed_since_last
+        self.total_calories += result.estimated_calories
+        self.total_images += 1
+
+        for food in result.food_items:
+            self.food_counts.add(food.name)
+            category = categorize_food(food.name)
+            if category:
+                self.food_categories[category] = self.food_categories.get(category, 0) + 1
+
+    def consume(self, analyses: Iterable[dict]):
+        """Fold a stream of analyses (timestamp order) without materializing it"""
+        for analysis in analyses:
+            self.add(analysis)
+
+    def is_folded(self, image_record: dict) -> bool:
+        """Whether a meal_images row was already processed by a previous run"""
+        if self.watermark is None:
+            return False
+        uploaded_at = image_record['uploaded_at']
+        return uploaded_at < self.watermark or (
+            uploaded_at == self.watermark and image_record.get('id') in self.watermark_ids
+        )
+
+    def record_failure(self, image_record: dict) -> bool:
+        """Count a failed analysis of a row; True once it has failed REPORT_MAX_ROW_ATTEMPTS runs and is skipped"""
+        key = str(image_record.get('id'))
+        attempts = self.failed_attempts.get(key, 0) + 1
+        if attempts < REPORT_MAX_ROW_ATTEMPTS:
+            self.failed_attempts[key] = attempts
+            return False
+        self.failed_attempts.pop(key, None)
+        self.rows_skipped += 1
+        return True
+
+    def advance_watermark(self, image_records: list):
+        """Mark rows as processed: folded, or skipped after repeated failures (see fold_row)"""
+        for record in image_records:
+            self.failed_attempts.pop(str(record.get('id')), None)
+            self.rows_seen += 1
+            uploaded_at = record['uploaded_at']
+            if self.watermark is None or uploaded_at > self.watermark:
+                self.watermark = uploaded_at
+                self.watermark_ids = []
+            if uploaded_at == self.watermark:
+                self.watermark_ids.append(record.get('id'))
+
+    def fold_row(self, image_record: dict, analysis: Optional[dict]) -> bool:
+        """Fold the next row in timestamp order; False if it failed and must be retried by a later run
+
+        A missing or zero-confidence analysis leaves the watermark in front of the
+        row, so rows after it are not folded in this run either.
+        """
+        if analysis is not None and analysis['analysis'].confidence > 0:
+            self.add(analysis)
+        elif not self.record_failure(image_record):
+            return False
+        self.advance_watermark([image_record])
+        return True
+
+    def keyset_cursor(self):
+        """(uploaded_at, id) of the last processed row, for resuming a keyset scan"""
+        if self.watermark is None:
+            return None
+        ids = [row_id for row_id in self.watermark_ids if row_id is not None]
+        return (self.watermark, max(ids) if ids else None)
+
+    @property
+    def session_count(self) -> int:
+        return self.closed_sessions + (1 if self.open_session else 0)
+
+    def to_state(self) -> dict:
+        return {
+            'rows_seen': self.rows_seen,
+            'total_images': self.total_images,
+            'closed_sessions': self.closed_sessions,
+            'closed_consumed': self.closed_consumed,
+            'total_calories': self.total_calories,
+            'interval_sum_hours': self.interval_sum_hours,
+            'interval_count': self.interval_count,
+            'open_session': self.open_session,
+            'food_counts': self.food_counts.to_state(),
+            'food_categories': self.food_categories,
+            'watermark': self.watermark,
+            'watermark_ids': self.watermark_ids,
+            'failed_attempts': self.failed_attempts,
+            'rows_skipped': self.rows_skipped,
+        }
+
+    def report_fields(self) -> dict:
+        """AnalysisResult fields (minus patient_id) for the current totals"""
+        sessions = self.session_count
+        avg_interval = self.interval_sum_hours / self.interval_count if self.interval_count else 0
+        consumed = self.closed_consumed + (self.open_session['consumed'] if self.open_session else 0)
+        avg_consumed_per_session = consumed / sessions if sessions else 0
+
+        # Generate recommendations based on meal sessions
+        recommendations = []
+
+        if avg_interval < 2:
+            recommendations.append("⚠️ Eating too frequently - consider spacing meals 3-4 hours apart")
+        elif avg_interval > 6:
+            recommendations.append("⚠️ Long gaps between meals - consider more regular eating schedule")
+        else:
+            recommendations.append("✅ Good meal timing - regular eating pattern detected")
+
+        if avg_consumed_per_session < 20:
+            recommendations.append("⚠️ Low food consumption per meal - consider increasing portion sizes")
+        elif avg_consumed_per_session > 80:
+            recommendations.append("⚠️ High food consumption per meal - consider portion control")
+        else:
+            recommendations.append("✅ Moderate food consumption per meal - good portion control")
+
+        if self.food_categories.get('vegetables', 0) < sessions * 0.3:
+            recommendations.append("🥬 Consider increasing vegetable intake")
+
+        most_common_foods = self.food_counts.top(5)
+
+        return {
+            'total_images_analyzed': self.total_images,
+            'eating_patterns': {
+                "total_meal_sessions": sessions,
+                "total_images": self.total_images,
+                "avg_interval_hours": round(avg_interval, 2),
+                "regular_eating": avg_interval >= 2 and avg_interval <= 6,
+                "avg_consumption_per_session": round(avg_consumed_per_session, 2),
+                "meal_grouping_note": "Images within 1 hour grouped as same meal"
+            },
+            'nutritional_summary': {
+                "total_calories": self.total_calories,
+                "avg_calories_per_session": round(self.total_calories / sessions, 2) if sessions else 0,
+                "food_categories": dict(self.food_categories),
+                "most_common_foods": most_common_foods
+            },
+            'recommendations': recommendations,
+            'confidence_score': 0.85,
+            'analysis_timestamp': int(time.time())
+        }
+
+class ReportStateStore:
+    """Persists ReportAggregator state per (patient, date range) in SQLite"""
+
+    def __init__(self, path: str = REPORT_STATE_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS report_state (
+                scope TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Finished reports, valid while the scope's meal_images watermark (the ETag) is unchanged
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                report_key TEXT PRIMARY KEY,
+                etag TEXT NOT NULL,
+                report TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def scope_key(patient_id: str, date_range_start: Optional[str], date_range_end: Optional[str]) -> str:
+        return f"{patient_id}|{date_range_start or ''}|{date_range_end or ''}"
+
+    def load(self, scope: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT state FROM report_state WHERE scope = ?", (scope,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, scope: str, state: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO report_state VALUES (?, ?, ?)",
+                (scope, json.dumps(state), time.time())
+            )
+            self._db.commit()
+
+    def reset(self, scope: str):
+        """Forget a scope so the next report is rebuilt from the full history"""
+        with self._lock:
+            self._db.execute("DELETE FROM report_state WHERE scope = ?", (scope,))
+            self._db.execute("DELETE FROM reports WHERE report_key LIKE ?", (scope + '|%',))
+            self._db.commit()
+
+    @staticmethod
+    def report_key(scope: str, analysis_type: str) -> str:
+        return f"{scope}|{analysis_type}"
+
+    @staticmethod
+    def etag(report_key: str, watermark: dict) -> str:
+        """Strong ETag for a report: changes whenever rows are added to or removed from its scope
+
+        The row count is what catches removals; the report pipeline then sees fewer
+        rows behind the state's watermark than it folded and reset()s the scope.
+        """
+        key = f"{report_key}|{watermark['count']}|{watermark['uploaded_at']}|{watermark['id']}"
+        return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+    def load_report(self, report_key: str, etag: str) -> Optional[dict]:
+        """The cached report if it was built for this ETag"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT report FROM reports WHERE report_key = ? AND etag = ?", (report_key, etag)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_report(self, report_key: str, etag: str, report: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)",
+                (report_key, etag, json.dumps(report), time.time())
+            )
+            self._db.commit()
+
+# Shared store instance
+report_state_store = ReportStateStore()
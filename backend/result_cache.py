@@ -0,0 +1,143 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "analysis_cache.db")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(180 * 24 * 3600)))
+
+# Run eviction every N writes instead of on every put
+EVICT_EVERY_N_PUTS = 100
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the raw image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """Persistent per-frame analysis cache keyed by (content hash, model, prompt version)"""
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, model, prompt_version)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used_at)")
+        # Stored objects never change, so a URL can be mapped to its content hash
+        # and checked without downloading the image again
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def get(self, digest: str, model: str, prompt_version: str) -> Optional[dict]:
+        """Return the cached result for an image hash, counting hits and misses"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM results WHERE content_hash = ? AND model = ? AND prompt_version = ?",
+                (digest, model, prompt_version)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._db.execute(
+                    "UPDATE results SET last_used_at = ? WHERE content_hash = ? AND model = ? AND prompt_version = ?",
+                    (now, digest, model, prompt_version)
+                )
+                self._db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def get_by_url(self, url: str, model: str, prompt_version: str) -> Optional[dict]:
+        """Return the cached result for a previously seen URL without counting a miss"""
+        with self._lock:
+            row = self._db.execute("SELECT content_hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        return self.get(row[0], model, prompt_version)
+
+    def put(self, digest: str, model: str, prompt_version: str, result: dict, url: Optional[str] = None):
+        """Store an analysis result (and optionally the URL it was downloaded from)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, model, prompt_version, json.dumps(result), now, now)
+            )
+            if url:
+                self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+            self._db.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY_N_PUTS == 0:
+                self._evict(now)
+
+    def remember_url(self, url: str, digest: str):
+        """Map a URL to the hash of its content"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+            self._db.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        expired = self._db.execute(
+            "DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        overflow = max(0, count - self.max_entries)
+        if overflow:
+            self._db.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used_at LIMIT ?)",
+                (overflow,)
+            )
+        self._db.execute("DELETE FROM urls WHERE content_hash NOT IN (SELECT content_hash FROM results)")
+        self._db.commit()
+        self.evictions += expired + overflow
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "evictions": self.evictions
+        }
+
+# Shared cache instance
+result_cache = ResultCache()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Run the live analysis agent as N session-sharded workers behind a dispatcher
+Set ANALYSIS_WORKERS=N for the storage agent too so it sends captures to the dispatcher
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from analysis_sharding import ANALYSIS_WORKERS, worker_port
+
+def start(name: str, script: str, env: dict) -> subprocess.Popen:
+    print(f"🚀 Starting {name}...")
+    return subprocess.Popen([sys.executable, script], env=env)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run session-sharded live analysis workers")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS or os.cpu_count() or 2,
+                        help="Worker processes (default: ANALYSIS_WORKERS, else one per core)")
+    args = parser.parse_args()
+
+    # The dispatcher and every worker must agree on the worker count
+    base_env = dict(os.environ, ANALYSIS_WORKERS=str(args.workers))
+    processes = []
+    for index in range(args.workers):
+        env = dict(base_env, ANALYSIS_WORKER_INDEX=str(index))
+        processes.append((f"Worker {index} (port {worker_port(index)})", start(f"worker {index}", "test.py", env)))
+    processes.append(("Dispatcher", start("dispatcher", "analysis_dispatcher.py", base_env)))
+
+    print(f"\n📊 Running {args.workers} workers + dispatcher")
+    print("Press Ctrl+C to stop all processes")
+    try:
+        while True:
+            time.sleep(5)
+            for name, process in list(processes):
+                if process.poll() is not None:
+                    print(f"⚠️ {name} has stopped (the dispatcher will move its sessions)")
+                    processes.remove((name, process))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping all processes...")
+        for name, process in processes:
+            process.terminate()
+        for name, process in processes:
+            process.wait()
+            print(f"✅ Stopped {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# session_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+# Sessions held in memory at once (least recently used are evicted first)
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1000"))
+# Idle sessions drop out of memory after this long; SQLite still has them
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", str(2 * 3600)))
+# Sessions idle for longer than this are deleted from SQLite
+SESSION_RETENTION_SECONDS = int(os.getenv("SESSION_RETENTION_SECONDS", str(30 * 24 * 3600)))
+# Other processes write the same file (sharded analysis workers, whose sessions move when the ring changes):
+# memory hits are checked against the row's updated_at so a session written elsewhere is never served stale
+SESSION_STORE_SHARED = (os.getenv("SESSION_STORE_SHARED", "").lower() in ("1", "true", "yes")
+                        or os.getenv("ANALYSIS_WORKER_INDEX") is not None)
+
+class SessionStore:
+    """Live meal session state: in-memory LRU+TTL over a write-through SQLite (WAL) table"""
+
+    def __init__(self, path: str = SESSION_STORE_PATH, max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = SESSION_CACHE_TTL_SECONDS, retention_seconds: int = SESSION_RETENTION_SECONDS,
+                 shared: bool = SESSION_STORE_SHARED):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.retention_seconds = retention_seconds
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+        # session_id -> (state, size in bytes, last used, updated_at of the SQLite row it mirrors)
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._db.commit()
+
+    def get(self, session_id: str) -> dict:
+        """A copy of the session's state ({} for a new session)"""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and now - entry[2] <= self.ttl_seconds:
+                if self.shared and self._updated_at(session_id) != entry[3]:
+                    # Another process wrote (or deleted) the session since it was cached here
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+                    self._cache.move_to_end(session_id)
+                    self._cache[session_id] = entry[:2] + (now, entry[3])
+                    return json.loads(entry[0])
+
+            # Not in memory (expired or stale there): read through to SQLite
+            self.misses += 1
+            row = self._db.execute(
+                "SELECT state, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self._forget(session_id)
+                return {}
+            self._remember(session_id, row[0], now, row[1])
+            return json.loads(row[0])
+
+    def _updated_at(self, session_id: str):
+        # Primary-key lookup of the version only; the state itself stays in memory
+        row = self._db.execute("SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, session_id: str, state: dict):
+        """Write the session to SQLite and memory"""
+        now = time.time()
+        encoded = json.dumps(state)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, encoded, now))
+            self._db.commit()
+            self._remember(session_id, encoded, now, now)
+
+    def _forget(self, session_id: str):
+        previous = self._cache.pop(session_id, None)
+        if previous is not None:
+            self._cache_bytes -= previous[1]
+
+    def _remember(self, session_id: str, encoded: str, now: float, updated_at: float):
+        # States are kept JSON-encoded: callers get fresh copies and sizes are exact
+        self._forget(session_id)
+        self._cache[session_id] = (encoded, len(encoded), now, updated_at)
+        self._cache_bytes += len(encoded)
+        self._evict(now)
+
+    def _evict(self, now: float):
+        # Oldest entries are at the front, so expired ones are found first
+        while self._cache:
+            session_id, (_, size, last_used, _) = next(iter(self._cache.items()))
+            if now - last_used > self.ttl_seconds:
+                self.ttl_evictions += 1
+            elif len(self._cache) > self.max_entries:
+                self.lru_evictions += 1
+            else:
+                break
+            self._cache.popitem(last=False)
+            self._cache_bytes -= size
+
+    def warm(self) -> int:
+        """Load the most recently active sessions into memory and drop expired ones from SQLite"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.retention_seconds,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT session_id, state, updated_at FROM sessions WHERE updated_at >= ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (now - self.ttl_seconds, self.max_entries)
+            ).fetchall()
+            # Oldest first so the LRU order matches activity
+            for session_id, encoded, updated_at in reversed(rows):
+                self._remember(session_id, encoded, updated_at, updated_at)
+            return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict(time.time())
+            lookups = self.hits + self.misses
+            return {
+                "cached_sessions": len(self._cache),
+                "cached_bytes": self._cache_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stale_hits": self.stale_hits,
+                "lru_evictions": self.lru_evictions,
+                "ttl_evictions": self.ttl_evictions
+            }
+
+# Shared store instance
+session_store = SessionStore()
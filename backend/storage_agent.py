@@ -1,22 +1,36 @@
 # storage_agent.py
 from uagents import Agent, Context, Protocol, Model
 from uagents.setup import fund_agent_if_low
-from supabase import create_client
+from uagents.communication import Dispenser
+from uagents.context import InternalContext
+from uagents.resolver import GlobalResolver
+from storage_backend import create_storage_client
+from frame_dedupe import frame_deduper, dhash
+from depth_format import encode_depth, decode_depth, DEPTH_CONTENT_TYPE
+from http_sidecar import start_sidecar, metrics_route
+from metrics import metrics
+from meal_images_query import DEFAULT_PATIENT_ID
+from meal_image_store import store_meal_image
+from analysis_sharding import ANALYSIS_WORKERS, ANALYSIS_AGENT_ADDRESS, DISPATCHER_ADDRESS, STORAGE_AGENT_SEED, STORAGE_AGENT_PORT, agent_resolver
+from ingest_queue import ingest_queue, IngestRejected
+from aiohttp import web
+import asyncio
 import base64
-import json
 import os
+import resource
 import time
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Supabase configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Supabase client, or the local backend when STORAGE_BACKEND=local
+supabase = create_storage_client()
 
-# Initialize Supabase client
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Binary ingest endpoint (raw image bodies instead of base64 UploadRequest)
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8011"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(10 * 1024 * 1024)))
 
 # Message Models
 class UploadRequest(Model):
@@ -24,6 +38,9 @@ class UploadRequest(Model):
     session_id: str
     frame_id: str
     user_id: str
+    depth_data: Optional[dict] = None  # {'values', 'width', 'height'} in metres, if captured
+    # user_id identifies the Lens session, not the patient; frames are stored under DEFAULT_PATIENT_ID unless set
+    patient_id: Optional[str] = None
 
 class AnalysisResult(Model):
     food_items: list
@@ -32,65 +49,78 @@ class AnalysisResult(Model):
     estimated_calories: int
     confidence: float
 
+class DedupeStats(Model):
+    frames_seen: int
+    frames_suppressed: int
+    suppressed_rate: float
+    sessions_tracked: int
+
+class IngestQueueStats(Model):
+    sessions_active: int
+    in_flight: int
+    queued: int
+    admitted: int
+    coalesced: int
+    dropped: int
+    completed: int
+    queue_depth: int
+    max_sessions: int
+
 # Supabase upload functions
-def upload_image_to_supabase(image_base64: str, session_id: str, frame_id: str) -> str:
+def upload_image_to_supabase(image_base64: str, session_id: str, frame_id: str,
+                             patient_id: str = DEFAULT_PATIENT_ID) -> str:
     """Upload image to Supabase storage and return public URL"""
     try:
-        image_bytes = base64.b64decode(image_base64)
-        timestamp = int(time.time())
-        
-        # Detect image format and use appropriate extension
-        if image_bytes.startswith(b'\x89PNG'):
-            file_path = f"{session_id}/{frame_id}_{timestamp}.png"
-        elif image_bytes.startswith(b'\xff\xd8\xff'):
-            file_path = f"{session_id}/{frame_id}_{timestamp}.jpg"
-        else:
-            # Default to PNG for unknown formats
-            file_path = f"{session_id}/{frame_id}_{timestamp}.png"
-        
-        # Upload to Supabase storage
-        supabase.storage.from_('meals').upload(file_path, image_bytes)
-        
-        # Get public URL
-        url = supabase.storage.from_('meals').get_public_url(file_path)
-        
-        # Also store metadata in Supabase database table
-        supabase.table('meal_images').insert({
-            'session_id': session_id,
-            'frame_id': frame_id,
-            'file_path': file_path,
-            'url': url,
-            'uploaded_at': timestamp,
-            'created_at': 'now()'
-        }).execute()
-        
-        return url
+        with metrics.track("base64_decode"):
+            image_bytes = base64.b64decode(image_base64)
+        metrics.add_bytes("base64_decode", len(image_bytes))
+    except Exception as e:
+        print(f"Error decoding image: {e}")
+        return ""
+    return upload_image_bytes_to_supabase(image_bytes, session_id, frame_id, patient_id)
+
+def upload_image_bytes_to_supabase(image_bytes: bytes, session_id: str, frame_id: str,
+                                   patient_id: str = DEFAULT_PATIENT_ID, uploaded_at: Optional[int] = None) -> str:
+    """Upload raw image bytes to Supabase storage and return public URL (uploaded_at defaults to now)"""
+    try:
+        # Content-addressed: identical bytes are stored (and analyzed) once
+        timestamp = int(time.time()) if uploaded_at is None else uploaded_at
+        return store_meal_image(supabase, image_bytes, session_id, frame_id, timestamp, patient_id)
     except Exception as e:
         print(f"Error uploading image: {e}")
         return ""
 
-def upload_depth_to_supabase(depth_data: dict, session_id: str, frame_id: str) -> str:
-    """Upload depth data to Supabase storage and return public URL"""
+def upload_depth_to_supabase(depth_data, session_id: str, frame_id: str) -> str:
+    """Upload depth data (values/width/height dict, or an encoded grid) to Supabase storage and return public URL"""
     try:
-        depth_json = json.dumps(depth_data).encode('utf-8')
+        # Compact binary grid (uint16 millimetres, compressed) instead of a JSON float list
+        if isinstance(depth_data, bytes):
+            depth_grid = depth_data
+        else:
+            depth_grid = encode_depth(depth_data['values'], depth_data['width'], depth_data['height'])
         timestamp = int(time.time())
-        file_path = f"{session_id}/{frame_id}_{timestamp}_depth.json"  # Include timestamp
+        file_path = f"{session_id}/{frame_id}_{timestamp}_depth.bin"  # Include timestamp
         
         # Upload to Supabase storage
-        supabase.storage.from_('depth-data').upload(file_path, depth_json)
+        with metrics.track("storage_upload"):
+            supabase.storage.from_('depth-data').upload(
+                file_path, depth_grid, file_options={"content-type": DEPTH_CONTENT_TYPE}
+            )
+        metrics.add_bytes("storage_upload", len(depth_grid))
         
         # Get public URL
         url = supabase.storage.from_('depth-data').get_public_url(file_path)
         
         # Store metadata in database
-        supabase.table('depth_data').insert({
-            'session_id': session_id,
-            'frame_id': frame_id,
-            'file_path': file_path,
-            'url': url,
-            'uploaded_at': timestamp,
-            'created_at': 'now()'
-        }).execute()
+        with metrics.track("metadata_insert"):
+            supabase.table('depth_data').insert({
+                'session_id': session_id,
+                'frame_id': frame_id,
+                'file_path': file_path,
+                'url': url,
+                'uploaded_at': timestamp,
+                'created_at': 'now()'
+            }).execute()
         
         return url
     except Exception as e:
@@ -98,58 +128,258 @@ def upload_depth_to_supabase(depth_data: dict, session_id: str, frame_id: str) -
         return ""
 
 # Create Storage Agent
+# Shared with the per-frame contexts of the binary ingest endpoint
+storage_resolver = agent_resolver() or GlobalResolver()
+
 storage_agent = Agent(
     name="storage_agent",
-    seed="storage_agent_seed_phrase",
-    port=8001,
-    endpoint=["http://0.0.0.0:8001/submit"],
+    seed=STORAGE_AGENT_SEED,
+    port=STORAGE_AGENT_PORT,
+    endpoint=[f"http://0.0.0.0:{STORAGE_AGENT_PORT}/submit"],
     agentverse="https://agentverse.ai",  # Connect to Agentverse
-    mailbox=True
+    mailbox=True,
+    resolve=storage_resolver,
+    # Frames overlap so ingest_queue can coalesce them; it keeps one analysis in flight per session
+    handle_messages_concurrently=True
 )
 
 fund_agent_if_low(storage_agent.wallet.address())
+metrics.set_agent(storage_agent.name)
 
-# Chat Protocol ONLY (no REST endpoints)
+# Chat Protocol
 storage_protocol = Protocol(name="StorageChat")
 
 @storage_protocol.on_message(model=UploadRequest, replies={AnalysisResult})
 async def handle_upload_and_analyze(ctx: Context, sender: str, msg: UploadRequest):
     ctx.logger.info(f"📨 Chat: Upload and analyze from {sender}")
     
+    try:
+        with metrics.track("base64_decode"):
+            image_bytes = base64.b64decode(msg.image_base64)
+        metrics.add_bytes("base64_decode", len(image_bytes))
+    except Exception as e:
+        ctx.logger.error(f"❌ Invalid image data: {e}")
+        image_bytes = b""
+    
+    try:
+        result = await ingest_queue.submit(
+            msg.session_id,
+            lambda: ingest_frame(ctx, image_bytes, msg.session_id, msg.frame_id, msg.user_id, msg.depth_data,
+                                 msg.patient_id or DEFAULT_PATIENT_ID)
+        )
+    except IngestRejected as e:
+        ctx.logger.warning(f"🚦 Dropped frame {msg.frame_id}: {e}")
+        result = AnalysisResult(
+            food_items=[{"name": "overloaded", "category": "error"}],
+            remaining_percent=100.0,
+            consumed_since_last=0.0,
+            estimated_calories=0,
+            confidence=0.0
+        )
+    
+    # Forward to original sender
+    await ctx.send(sender, result)
+
+async def ingest_frame(ctx: Context, image_bytes: bytes, session_id: str, frame_id: str, user_id: str,
+                       depth_data=None, patient_id: str = DEFAULT_PATIENT_ID):
+    """Dedupe, upload and analyze one frame (with its depth grid, if any); returns the analysis result to reply with
+
+    The frame is stored under patient_id, which reports query; user_id only travels with the analysis request.
+    """
+    # Skip upload and analysis when the plate looks the same as the last analyzed frame
+    try:
+        frame_hash = await asyncio.to_thread(dhash, image_bytes)
+    except Exception as e:
+        ctx.logger.warning(f"Could not hash frame: {e}")
+        frame_hash = None
+    
+    previous_result = frame_deduper.lookup(session_id, frame_hash)
+    if previous_result is not None:
+        stats = frame_deduper.stats()
+        ctx.logger.info(f"⏭️ Unchanged frame {frame_id} suppressed ({stats['frames_suppressed']}/{stats['frames_seen']} so far)")
+        return previous_result
+    
     # Upload only JPEG to Supabase
-    image_url = upload_image_to_supabase(msg.image_base64, msg.session_id, msg.frame_id)
+    image_url = ""
+    if image_bytes:
+        image_url = await asyncio.to_thread(upload_image_bytes_to_supabase, image_bytes, session_id, frame_id, patient_id)
     
     if not image_url:
-        await ctx.send(sender, AnalysisResult(
+        return AnalysisResult(
             food_items=[{"name": "upload_failed", "category": "error"}],
             remaining_percent=100.0,
             consumed_since_last=0.0,
             estimated_calories=0,
             confidence=0.0
-        ))
-        return
+        )
     
-    # Send to Analysis Agent with hardcoded depth data
-    from test import CaptureRequest, ANALYSIS_AGENT_ADDRESS
+    # The analysis agent measures volume from the captured grid, and uses hardcoded depth data without one
+    depth_url = ""
+    if depth_data:
+        depth_url = await asyncio.to_thread(upload_depth_to_supabase, depth_data, session_id, frame_id)
+        if not depth_url:
+            ctx.logger.warning(f"Depth upload failed for {frame_id}, analyzing without it")
+    
+    # Send to Analysis Agent
+    # Importing test.py would register a second, never-running analysis agent in this process
+    # and swallow messages meant for the real one
+    from analysis_models import CaptureRequest, AnalysisResult as FrameAnalysis
     
     capture_req = CaptureRequest(
-        session_id=msg.session_id,
-        user_id=msg.user_id,
+        session_id=session_id,
+        user_id=user_id,
         image_url=image_url,
-        timestamp=int(time.time())
+        timestamp=int(time.time()),
+        depth_url=depth_url or None
     )
     
+    # Sharded deployments go through the dispatcher, which keeps each session on one worker
+    analysis_address = DISPATCHER_ADDRESS if ANALYSIS_WORKERS else ANALYSIS_AGENT_ADDRESS
+    
     # Wait for Analysis Agent response
-    analysis_result = await ctx.send(ANALYSIS_AGENT_ADDRESS, capture_req)
+    analysis_result, status = await ctx.send_and_receive(analysis_address, capture_req, response_type=FrameAnalysis)
     
-    # Forward to original sender
-    await ctx.send(sender, analysis_result)
+    if analysis_result is None:
+        ctx.logger.error(f"❌ No analysis reply: {status}")
+        return AnalysisResult(
+            food_items=[{"name": "analysis_failed", "category": "error"}],
+            remaining_percent=100.0,
+            consumed_since_last=0.0,
+            estimated_calories=0,
+            confidence=0.0
+        )
+    
+    # Re-wrap in this agent's reply model: replies={AnalysisResult} only accepts its schema digest
+    result = AnalysisResult(**analysis_result.model_dump())
+    frame_deduper.record(session_id, frame_hash, result)
+    return result
 
 storage_agent.include(storage_protocol)
 
+@storage_agent.on_rest_get("/dedupe_stats", DedupeStats)
+async def get_dedupe_stats(ctx: Context) -> DedupeStats:
+    """How many unchanged frames skipped upload and analysis"""
+    return DedupeStats(**frame_deduper.stats())
+
+@storage_agent.on_rest_get("/ingest_queue_stats", IngestQueueStats)
+async def get_ingest_queue_stats(ctx: Context) -> IngestQueueStats:
+    """Frames in flight and queued, plus how many were coalesced or dropped"""
+    return IngestQueueStats(**ingest_queue.stats())
+
+# Binary ingest (raw or multipart image bodies, no base64)
+ingest_stats = {
+    "frames": 0,
+    "bytes_on_wire": 0,
+    "base64_equivalent_bytes": 0,
+    "peak_rss_kb": 0
+}
+
+async def read_part(part) -> bytes:
+    """Body of one multipart part, up to INGEST_MAX_BYTES"""
+    # Joined once from the chunks; part.read() would build a bytearray that still needs a bytes() copy
+    chunks, size = [], 0
+    while chunk := await part.read_chunk():
+        size += len(chunk)
+        if size > INGEST_MAX_BYTES:
+            raise web.HTTPRequestEntityTooLarge(max_size=INGEST_MAX_BYTES, actual_size=size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def read_ingest_request(request: web.Request):
+    """Return (image_bytes, depth_grid, fields) from a raw or multipart/form-data body
+
+    Only multipart bodies can carry a depth grid (a 'depth' part in depth_format.py's binary format).
+    """
+    fields = dict(request.query)
+    if request.content_length and request.content_length > INGEST_MAX_BYTES:
+        raise web.HTTPRequestEntityTooLarge(max_size=INGEST_MAX_BYTES, actual_size=request.content_length)
+    
+    if request.content_type.startswith('multipart/'):
+        image_bytes, depth_grid = b"", None
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'image':
+                image_bytes = await read_part(part)
+            elif part.name == 'depth':
+                depth_grid = await read_part(part)
+            elif part.name:
+                fields[part.name] = await part.text()
+        return image_bytes, depth_grid, fields
+    
+    return await request.read(), None, fields
+
+# Sends the binary endpoint's analysis requests; started with the ingest server
+ingest_dispenser = Dispenser()
+ingest_dispenser_task = None
+
+def frame_context(ctx: Context) -> InternalContext:
+    """Context with its own uagents session for one binary-ingest frame"""
+    return InternalContext(
+        agent=ctx.agent,
+        storage=ctx.storage,
+        ledger=ctx.ledger,
+        resolver=storage_resolver,
+        dispenser=ingest_dispenser,
+        logger=ctx.logger
+    )
+
+def make_ingest_routes(ctx: Context) -> list:
+    """aiohttp routes bound to the agent context captured at startup"""
+    
+    async def ingest(request: web.Request) -> web.Response:
+        image_bytes, depth_grid, fields = await read_ingest_request(request)
+        missing = [name for name in ('session_id', 'frame_id', 'user_id') if not fields.get(name)]
+        if missing or not image_bytes:
+            return web.json_response({"error": f"Missing fields: {missing or ['image']}"}, status=400)
+        if depth_grid is not None:
+            # Decode fully so a truncated or corrupt grid is rejected here, not when the frame is analyzed
+            try:
+                await asyncio.to_thread(decode_depth, depth_grid)
+            except Exception as e:
+                return web.json_response({"error": f"depth must be a binary depth grid (depth_format.py): {e}"},
+                                         status=400)
+        
+        ingest_stats["frames"] += 1
+        ingest_stats["bytes_on_wire"] += len(image_bytes)
+        ingest_stats["base64_equivalent_bytes"] += 4 * ((len(image_bytes) + 2) // 3)
+        ctx.logger.info(f"📨 Binary ingest: {len(image_bytes)} bytes for {fields['session_id']}/{fields['frame_id']}")
+        
+        # Analysis replies are matched on the uagents session, which the startup context shares
+        # across requests; a fresh context per frame keeps concurrent frames from taking each other's reply
+        frame_ctx = frame_context(ctx)
+        try:
+            result = await ingest_queue.submit(
+                fields['session_id'],
+                lambda: ingest_frame(frame_ctx, image_bytes, fields['session_id'], fields['frame_id'], fields['user_id'],
+                                     depth_grid, fields.get('patient_id') or DEFAULT_PATIENT_ID)
+            )
+        except IngestRejected as e:
+            ctx.logger.warning(f"🚦 Dropped frame {fields['frame_id']}: {e}")
+            return web.json_response({"error": "Too many sessions in progress, retry shortly"}, status=503,
+                                     headers={"Retry-After": "1"})
+        ingest_stats["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return web.Response(text=result.model_dump_json(), content_type='application/json')
+    
+    async def get_ingest_stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(ingest_stats, queue=ingest_queue.stats()))
+    
+    return [
+        web.post('/ingest', ingest),
+        web.get('/ingest_stats', get_ingest_stats),
+        metrics_route()
+    ]
+
+@storage_agent.on_event("startup")
+async def start_ingest_server(ctx: Context):
+    global ingest_dispenser_task
+    ingest_dispenser_task = asyncio.create_task(ingest_dispenser.run())
+    await start_sidecar(make_ingest_routes(ctx), INGEST_PORT, max_body_bytes=INGEST_MAX_BYTES)
+    ctx.logger.info(f"📥 Binary ingest endpoint: http://localhost:{INGEST_PORT}/ingest")
+
 if __name__ == "__main__":
     print("🚀 Starting Storage Agent...")
     print(f"📍 Agent address: {storage_agent.address}")
     print(f"🌐 HTTP endpoint: http://localhost:8001")
+    print(f"📥 Binary ingest: http://localhost:{INGEST_PORT}/ingest")
     print("Copy this address to register on Agentverse!")
     storage_agent.run()
\ No newline at end of file
@@ -0,0 +1,307 @@
+# storage_backend.py
+#
+# create_storage_client() returns the Supabase client or LocalStorageClient, which
+# implements the part of the supabase-py API the agents use:
+#   table(name).select(columns, count='exact').eq/gt/gte/lt/lte(...).or_(...).order(...).limit(n).execute()
+#   table(name).insert(row) / .upsert(row, on_conflict=..., ignore_duplicates=...)
+#   storage.from_(bucket).upload(path, data, file_options) / .download(path) / .get_public_url(path)
+# Local metadata lives in SQLite (WAL, shared by the agent processes on one host) and objects
+# in a directory tree fanned out by path hash, addressed by file:// URLs.
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import unquote, urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "supabase" (default) or "local"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+# Root directory of the local backend: metadata.db plus one object tree per bucket
+LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", "local_storage")
+
+# Mirrors the Supabase tables (README setup SQL and backend/migrations/)
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meal_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    frame_id TEXT NOT NULL,
+    patient_id TEXT,
+    file_path TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content_hash TEXT,
+    uploaded_at INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS meal_images_patient_uploaded_id_idx ON meal_images (patient_id, uploaded_at, id);
+CREATE UNIQUE INDEX IF NOT EXISTS meal_images_content_session_frame_idx ON meal_images (content_hash, session_id, frame_id);
+CREATE INDEX IF NOT EXISTS meal_images_session_idx ON meal_images (session_id, uploaded_at);
+
+CREATE TABLE IF NOT EXISTS depth_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    frame_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    url TEXT NOT NULL,
+    uploaded_at INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+def create_storage_client(backend: str = STORAGE_BACKEND):
+    """Client for the configured backend"""
+    if backend == "local":
+        return LocalStorageClient(LOCAL_STORAGE_PATH)
+    if backend != "supabase":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend} (expected 'supabase' or 'local')")
+    from supabase import create_client
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+def _column(name: str) -> str:
+    name = name.strip()
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name!r}")
+    return f'"{name}"'
+
+def _literal(value: str):
+    """PostgREST filter values arrive as text; compare numbers as numbers"""
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def _split_top_level(expression: str) -> List[str]:
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(expression):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(expression[start:index])
+            start = index + 1
+    parts.append(expression[start:])
+    return parts
+
+def _parse_filter(expression: str, joiner: str) -> tuple:
+    """Translate a PostgREST logic filter such as "a.gt.1,and(a.eq.1,id.gt.5)" into SQL"""
+    clauses, params = [], []
+    for term in _split_top_level(expression):
+        term = term.strip()
+        nested = re.match(r"^(and|or)\((.*)\)$", term)
+        if nested:
+            sql, nested_params = _parse_filter(nested.group(2), nested.group(1).upper())
+        else:
+            column, operator, value = term.split('.', 2)
+            if operator not in _OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            sql, nested_params = f"{_column(column)} {_OPERATORS[operator]} ?", [_literal(value)]
+        clauses.append(f"({sql})")
+        params.extend(nested_params)
+    return f" {joiner} ".join(clauses), params
+
+class LocalResponse:
+    def __init__(self, data: list, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+class LocalQuery:
+    """Chainable query on one SQLite table, executed by execute()"""
+
+    def __init__(self, client: 'LocalStorageClient', table: str):
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid table name: {table!r}")
+        self._client = client
+        self._table = table
+        self._action = 'select'
+        self._columns = '*'
+        self._count = None
+        self._rows: List[dict] = []
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._where: List[str] = []
+        self._params: list = []
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+
+    def select(self, columns: str = '*', count: Optional[str] = None) -> 'LocalQuery':
+        self._action = 'select'
+        self._columns = '*' if columns.strip() == '*' else ", ".join(_column(c) for c in columns.split(','))
+        self._count = count
+        return self
+
+    def insert(self, rows) -> 'LocalQuery':
+        self._action = 'insert'
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', ignore_duplicates: bool = False) -> 'LocalQuery':
+        self.insert(rows)
+        self._on_conflict = [_column(c) for c in (on_conflict or 'id').split(',')]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def _filter(self, column: str, operator: str, value) -> 'LocalQuery':
+        self._where.append(f"{_column(column)} {_OPERATORS[operator]} ?")
+        self._params.append(value)
+        return self
+
+    def eq(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column: str, value) -> 'LocalQuery':
+        return self._filter(column, 'lte', value)
+
+    def or_(self, filters: str) -> 'LocalQuery':
+        sql, params = _parse_filter(filters, 'OR')
+        self._where.append(f"({sql})")
+        self._params.extend(params)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'LocalQuery':
+        self._order.append(f"{_column(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, count: int) -> 'LocalQuery':
+        self._limit = int(count)
+        return self
+
+    def execute(self) -> LocalResponse:
+        if self._action == 'select':
+            return self._client._select(self)
+        return self._client._insert(self)
+
+class LocalBucket:
+    """One bucket of the object store: files under <root>/<bucket>/<hash fan-out>/<path>"""
+
+    def __init__(self, client: 'LocalStorageClient', bucket: str):
+        if not re.match(r"^[A-Za-z0-9_-]+$", bucket):
+            raise ValueError(f"Invalid bucket name: {bucket!r}")
+        self._client = client
+        self._bucket = bucket
+
+    def _file(self, path: str) -> Path:
+        if path.startswith('/') or '..' in path.split('/'):
+            raise ValueError(f"Invalid object path: {path!r}")
+        # Two hex levels keep directories small however many sessions or objects there are
+        fan_out = hashlib.sha1(path.encode()).hexdigest()
+        return self._client.root / self._bucket / fan_out[:2] / fan_out[2:4] / path
+
+    def upload(self, path: str, file, file_options: Optional[dict] = None):
+        target = self._file(path)
+        upsert = str((file_options or {}).get('upsert', '')).lower() == 'true'
+        if target.exists() and not upsert:
+            raise FileExistsError(f"Duplicate: {self._bucket}/{path} already exists")
+        data = file if isinstance(file, (bytes, bytearray, memoryview)) else Path(file).read_bytes()
+
+        # Write then rename, so readers never see a partial object
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, target)
+        return {'path': path, 'full_path': f"{self._bucket}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        return read_object(self._file(path))
+
+    def get_public_url(self, path: str) -> str:
+        return self._file(path).resolve().as_uri()
+
+class LocalStorage:
+    def __init__(self, client: 'LocalStorageClient'):
+        self._client = client
+
+    def from_(self, bucket: str) -> LocalBucket:
+        return LocalBucket(self._client, bucket)
+
+class LocalStorageClient:
+    """Drop-in for the Supabase client backed by SQLite metadata and an on-disk object store"""
+
+    def __init__(self, root: str = LOCAL_STORAGE_PATH):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.storage = LocalStorage(self)
+        self._lock = threading.Lock()
+        # Several agent processes share the database; wait for each other's writes
+        self._db = sqlite3.connect(str(self.root / "metadata.db"), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(LOCAL_SCHEMA)
+        self._db.commit()
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    def _select(self, query: LocalQuery) -> LocalResponse:
+        where = f" WHERE {' AND '.join(query._where)}" if query._where else ""
+        sql = f"SELECT {query._columns} FROM {query._table}{where}"
+        if query._order:
+            sql += f" ORDER BY {', '.join(query._order)}"
+        if query._limit is not None:
+            sql += f" LIMIT {query._limit}"
+        with self._lock:
+            rows = [dict(row) for row in self._db.execute(sql, query._params)]
+            count = None
+            if query._count:
+                count = self._db.execute(f"SELECT COUNT(*) FROM {query._table}{where}", query._params).fetchone()[0]
+        return LocalResponse(rows, count)
+
+    def _insert(self, query: LocalQuery) -> LocalResponse:
+        inserted = []
+        with self._lock:
+            for row in query._rows:
+                # Postgres evaluates now(); SQLite would store the text
+                row = {key: (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()) if value == 'now()' else value)
+                       for key, value in row.items()}
+                columns = ", ".join(_column(key) for key in row)
+                sql = f"INSERT INTO {query._table} ({columns}) VALUES ({', '.join('?' for _ in row)})"
+                if query._on_conflict:
+                    conflict = ", ".join(query._on_conflict)
+                    if query._ignore_duplicates:
+                        sql += f" ON CONFLICT ({conflict}) DO NOTHING"
+                    else:
+                        updates = ", ".join(f"{_column(key)} = excluded.{_column(key)}" for key in row)
+                        sql += f" ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+                inserted.extend(dict(r) for r in self._db.execute(sql + " RETURNING *", list(row.values())))
+            self._db.commit()
+        return LocalResponse(inserted)
+
+def read_object(path) -> bytes:
+    """Read an object file in one call"""
+    return Path(path).read_bytes()
+
+def is_file_url(url: str) -> bool:
+    return url.startswith("file://")
+
+def file_url_path(url: str, root: str = LOCAL_STORAGE_PATH) -> str:
+    """Filesystem path of a file:// URL from the local backend; paths outside its root are rejected"""
+    path = os.path.realpath(unquote(urlparse(url).path))
+    root = os.path.realpath(root)
+    if os.path.commonpath([path, root]) != root:
+        raise ValueError(f"{url} is outside the local storage root {root}")
+    return path
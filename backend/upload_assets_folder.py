@@ -1,10 +1,34 @@
 # upload_assets_folder.py
+import argparse
 import base64
+import hashlib
 import json
+import threading
 import time
 import os
 import glob
-from storage_agent import upload_image_to_supabase
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from PIL import Image
+from storage_agent import upload_image_to_supabase, upload_image_bytes_to_supabase
+from meal_images_query import DEFAULT_PATIENT_ID
+
+load_dotenv()
+
+# Bulk mode: parallel uploads and the overall uploads/second cap (0 = unlimited)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+UPLOAD_RATE_LIMIT = float(os.getenv("UPLOAD_RATE_LIMIT", "5"))
+# Append-only JSONL record of bulk uploads; files listed as uploaded are skipped on re-runs
+UPLOAD_MANIFEST_PATH = os.getenv("UPLOAD_MANIFEST_PATH", "upload_manifest.jsonl")
+# Bulk mode: photos further apart than this, or in another subfolder, belong to another meal session
+UPLOAD_SESSION_GAP_SECONDS = int(os.getenv("UPLOAD_SESSION_GAP_SECONDS", str(30 * 60)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+
+# EXIF tags for when a photo was taken
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
 
 def image_to_base64(image_path: str) -> str:
     """Convert image file to base64 string"""
@@ -98,5 +122,218 @@ def batch_upload_assets_folder(interval_seconds: int = 30):
         json.dump(uploaded_images, f, indent=2)
     print(f"📄 Results saved to: {results_file}")
 
+class RateLimiter:
+    """Space calls at least 1/rate seconds apart across all threads"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class UploadManifest:
+    """Append-only JSONL log of bulk uploads, one line per file as soon as it finishes"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.uploaded = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partial last line from an interrupted run
+                    if entry.get('status') == 'uploaded':
+                        self.uploaded.add(entry['key'])
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+    
+    def append(self, entry: dict):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            if entry.get('status') == 'uploaded':
+                self.uploaded.add(entry['key'])
+    
+    def close(self):
+        self._file.close()
+
+def file_key(image_path: str, folder: str) -> str:
+    """Manifest key: relative path, size and mtime, so edited files upload again"""
+    stat = os.stat(image_path)
+    return f"{os.path.relpath(image_path, folder)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def find_images(folder: str) -> list:
+    """All images under folder (recursively), in a stable order"""
+    image_files = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                image_files.append(os.path.join(root, name))
+    return sorted(image_files)
+
+def capture_time(image_path: str) -> int:
+    """When the photo was taken: EXIF DateTimeOriginal (or DateTime), else the file's modification time"""
+    try:
+        # Only the header is read; the pixels are never decoded
+        with Image.open(image_path) as image:
+            exif = image.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if value:
+            return int(time.mktime(time.strptime(value.strip('\x00 '), "%Y:%m:%d %H:%M:%S")))
+    except Exception:
+        pass
+    return int(os.stat(image_path).st_mtime)
+
+def plan_sessions(image_files: list, folder: str, gap_seconds: int = UPLOAD_SESSION_GAP_SECONDS) -> dict:
+    """image_path -> (session_id, capture time), starting a session per subfolder and at every gap over gap_seconds
+
+    Planned over every file, uploaded or not, so a resumed run puts files in the same sessions.
+    """
+    times = {image_path: capture_time(image_path) for image_path in image_files}
+    subfolders = {image_path: os.path.dirname(os.path.relpath(image_path, folder)) for image_path in image_files}
+    plan, session_id, previous = {}, None, None
+    for image_path in sorted(image_files, key=lambda path: (subfolders[path], times[path], path)):
+        subfolder, taken_at = subfolders[image_path], times[image_path]
+        if previous is None or subfolder != previous[0] or taken_at - previous[1] > gap_seconds:
+            session_id = f"assets_{taken_at}_{hashlib.sha1(subfolder.encode()).hexdigest()[:8]}"
+        plan[image_path] = (session_id, taken_at)
+        previous = (subfolder, taken_at)
+    return plan
+
+def format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def upload_file(image_path: str, folder: str, key: str, session_id: str, uploaded_at: int, patient_id: str,
+                limiter: RateLimiter, manifest: UploadManifest) -> dict:
+    """Upload one file in bulk mode, dated uploaded_at (its capture time), and record it in the manifest"""
+    relative_path = os.path.relpath(image_path, folder)
+    # Derived from the path so parallel uploads never share a storage path
+    frame_id = f"frame_{hashlib.sha1(relative_path.encode()).hexdigest()[:16]}"
+    entry = {'key': key, 'filename': relative_path, 'session_id': session_id, 'frame_id': frame_id}
+    
+    try:
+        with open(image_path, 'rb') as image_file:
+            image_bytes = image_file.read()
+    except OSError as e:
+        entry.update(status='failed', error=str(e), bytes=0)
+    else:
+        limiter.wait()
+        image_url = upload_image_bytes_to_supabase(image_bytes, session_id, frame_id, patient_id, uploaded_at)
+        if image_url:
+            entry.update(status='uploaded', url=image_url, bytes=len(image_bytes), uploaded_at=uploaded_at)
+        else:
+            entry.update(status='failed', error="upload failed", bytes=len(image_bytes))
+    
+    # Written by the worker itself, so an interrupted run keeps everything that finished
+    manifest.append(entry)
+    return entry
+
+def bulk_upload_assets_folder(folder: str = "assets", workers: int = UPLOAD_WORKERS, rate: float = UPLOAD_RATE_LIMIT,
+                              manifest_path: str = UPLOAD_MANIFEST_PATH, session_id: str = None,
+                              patient_id: str = DEFAULT_PATIENT_ID, gap_seconds: int = UPLOAD_SESSION_GAP_SECONDS):
+    """Upload a folder with a worker pool and rate limit, resuming from the manifest
+
+    Rows are dated by capture time and grouped into sessions by subfolder and time gap,
+    unless session_id puts every file in one session.
+    """
+    print("🚀 Starting bulk upload")
+    print(f"👷 Workers: {workers}, rate limit: {f'{rate:g}/s' if rate > 0 else 'none'}")
+    
+    if not os.path.exists(folder):
+        print(f"❌ Folder not found: {folder}")
+        return
+    
+    manifest = UploadManifest(manifest_path)
+    image_files = find_images(folder)
+    pending = []
+    for image_path in image_files:
+        key = file_key(image_path, folder)
+        if key not in manifest.uploaded:
+            pending.append((image_path, key))
+    
+    print(f"📁 Found {len(image_files)} images, {len(image_files) - len(pending)} already in {manifest_path}")
+    if not pending:
+        manifest.close()
+        print("✅ Nothing to upload")
+        return
+    
+    plan = plan_sessions(image_files, folder, gap_seconds)
+    if session_id:
+        plan = {image_path: (session_id, taken_at) for image_path, (_, taken_at) in plan.items()}
+    print(f"🍽️ {len({plan[image_path][0] for image_path, _ in pending})} sessions to upload into")
+    limiter = RateLimiter(rate)
+    started = time.time()
+    done = failed = total_bytes = 0
+    last_report = 0.0
+    
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = [
+        pool.submit(upload_file, image_path, folder, key, *plan[image_path], patient_id, limiter, manifest)
+        for image_path, key in pending
+    ]
+    try:
+        for future in as_completed(futures):
+            entry = future.result()
+            done += 1
+            total_bytes += entry['bytes']
+            if entry['status'] != 'uploaded':
+                failed += 1
+                print(f"\n❌ {entry['filename']}: {entry['error']}")
+            
+            # Live throughput and ETA, at most twice a second
+            now = time.time()
+            if now - last_report >= 0.5 or done == len(pending):
+                last_report = now
+                elapsed = max(now - started, 1e-6)
+                per_second = done / elapsed
+                eta = (len(pending) - done) / per_second
+                print(f"\r📈 {done}/{len(pending)} ({failed} failed) | {per_second:.1f} files/s | "
+                      f"{total_bytes / elapsed / 1e6:.2f} MB/s | ETA {format_eta(eta)}   ", end="", flush=True)
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted, finishing uploads already in progress...")
+        pool.shutdown(wait=True, cancel_futures=True)
+        manifest.close()
+        print(f"📄 Re-run to resume from {manifest_path}")
+        return
+    pool.shutdown()
+    manifest.close()
+    
+    print(f"\n{'='*50}")
+    print(f"🎉 BULK UPLOAD COMPLETE in {format_eta(time.time() - started)}")
+    print(f"✅ Uploaded: {done - failed}")
+    print(f"❌ Failed (retried on the next run): {failed}")
+    print(f"📄 Manifest: {manifest_path}")
+
 if __name__ == "__main__":
-    batch_upload_assets_folder(30)  # 30 second intervals
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Upload the assets folder to Supabase")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Parallel, rate-limited, resumable upload instead of demo pacing")
+    parser.add_argument("--folder", default="assets", help="Folder to upload in bulk mode, including subfolders")
+    parser.add_argument("--interval", type=int, default=30, help="Seconds between uploads in demo mode")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="Parallel uploads in bulk mode")
+    parser.add_argument("--rate", type=float, default=UPLOAD_RATE_LIMIT, help="Max uploads per second (0 = unlimited)")
+    parser.add_argument("--manifest", default=UPLOAD_MANIFEST_PATH, help="Bulk mode manifest (JSONL)")
+    parser.add_argument("--session-id", help="One session for all bulk uploads (default: per subfolder and time gap)")
+    parser.add_argument("--session-gap", type=int, default=UPLOAD_SESSION_GAP_SECONDS,
+                        help="Seconds between photos that start a new session in bulk mode")
+    parser.add_argument("--patient-id", default=DEFAULT_PATIENT_ID, help="Patient the uploads belong to")
+    args = parser.parse_args()
+    
+    if args.bulk:
+        bulk_upload_assets_folder(args.folder, args.workers, args.rate, args.manifest, args.session_id, args.patient_id,
+                                  args.session_gap)
+    else:
+        batch_upload_assets_folder(args.interval)  # 30 second intervals by default
\ No newline at end of file